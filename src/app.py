@@ -1,16 +1,22 @@
+import asyncio
 import os
+import shutil
+import time
 import uuid
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import re
 import streamlit as st
 import customer_flow, config, complaint_manager
-from openai import OpenAI
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import FAISS
+import llm_rag
+from openai import OpenAI, AsyncOpenAI, APIConnectionError, APITimeoutError, RateLimitError
 from auth import init_auth_state, login_ui_inline, logout
 from ui import app_header
 from customer_flow import CustomerSession, handle_customer_message
-from config import COMPLAINT_IMAGES_DIR
+from config import COMPLAINT_IMAGES_DIR, COMPLAINTS_FILE
+
+_COMPLAINTS_FILE_STR = str(COMPLAINTS_FILE)
 
 
 
@@ -26,23 +32,21 @@ st.set_page_config(
 # =========================
 # Language helper (ONLY for uploader text)
 # =========================
-def _detect_user_lang(messages) -> str:
+_ARABIC_RE = re.compile(r"[\u0600-\u06FF]")
+_LATIN_RE = re.compile(r"[A-Za-z]")
+
+def _detect_user_lang_single(text: str) -> str:
     """
-    Detect language from LAST user message:
+    Detect language from ONE user message:
     returns: "ar" | "en" | "bi"
     """
-    last_user = ""
-    for m in reversed(messages or []):
-        if m.get("role") == "user":
-            last_user = (m.get("content") or "").strip()
-            break
-
-    if not last_user:
+    t = (text or "").strip()
+    if not t:
         return "bi"
 
-    if re.search(r"[\u0600-\u06FF]", last_user):
+    if _ARABIC_RE.search(t):
         return "ar"
-    if re.search(r"[A-Za-z]", last_user):
+    if _LATIN_RE.search(t):
         return "en"
     return "bi"
 
@@ -71,51 +75,119 @@ app_header("TrustLine AI", "Customer Support Assistant")
 # =========================
 # Helpers: LLM + RAG
 # =========================
+# Retry transient OpenAI failures (429 / timeouts) up to 3 attempts,
+# and cap concurrent in-flight requests across chat sessions.
+_LLM_RETRY_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError)
+_LLM_MAX_ATTEMPTS = 3
+_LLM_MAX_CONCURRENCY = 10
+
+
 class GPTWrapper:
     def __init__(self, api_key: str):
         self.client = OpenAI(api_key=api_key)
-
-    def invoke(self, messages):
-        resp = self.client.chat.completions.create(
-            model="gpt-4.1",
-            messages=messages,
-            temperature=0.3
-        )
-        # customer_flow expects .content
-        return resp.choices[0].message
-
+        self.aclient = AsyncOpenAI(api_key=api_key)
+        # asyncio.Semaphore binds to the first loop that waits on it, and
+        # invoke_many spins a fresh loop per call, so keep one per loop
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _loop_semaphore(self):
+        loop = asyncio.get_running_loop()
+        sem = self._semaphores.get(loop)
+        if sem is None:
+            sem = self._semaphores.setdefault(loop, asyncio.Semaphore(_LLM_MAX_CONCURRENCY))
+        return sem
+
+    def invoke(self, messages, model=None, temperature=None):
+        for attempt in range(_LLM_MAX_ATTEMPTS):
+            try:
+                resp = self.client.chat.completions.create(
+                    model=model or "gpt-4.1",
+                    messages=messages,
+                    temperature=0.3 if temperature is None else temperature
+                )
+                # customer_flow expects .content
+                return resp.choices[0].message
+            except _LLM_RETRY_ERRORS:
+                if attempt == _LLM_MAX_ATTEMPTS - 1:
+                    raise
+                time.sleep(2 ** attempt)
+
+    def stream(self, messages, model=None, temperature=None):
+        # yields text deltas as they arrive; retries only apply before the
+        # first chunk (a stream that dies mid-flight surfaces to the caller)
+        for attempt in range(_LLM_MAX_ATTEMPTS):
+            try:
+                chunks = self.client.chat.completions.create(
+                    model=model or "gpt-4.1",
+                    messages=messages,
+                    temperature=0.3 if temperature is None else temperature,
+                    stream=True
+                )
+                break
+            except _LLM_RETRY_ERRORS:
+                if attempt == _LLM_MAX_ATTEMPTS - 1:
+                    raise
+                time.sleep(2 ** attempt)
+        for chunk in chunks:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                yield delta
+
+    async def ainvoke(self, messages, model=None, temperature=None):
+        async with self._loop_semaphore():
+            for attempt in range(_LLM_MAX_ATTEMPTS):
+                try:
+                    resp = await self.aclient.chat.completions.create(
+                        model=model or "gpt-4.1",
+                        messages=messages,
+                        temperature=0.3 if temperature is None else temperature
+                    )
+                    return resp.choices[0].message
+                except _LLM_RETRY_ERRORS:
+                    if attempt == _LLM_MAX_ATTEMPTS - 1:
+                        raise
+                    await asyncio.sleep(2 ** attempt)
+
+    async def ainvoke_many(self, message_batches):
+        return await asyncio.gather(*(self.ainvoke(m) for m in message_batches))
+
+    def invoke_many(self, message_batches):
+        # sync entry point for callers without an event loop (Streamlit handlers)
+        return asyncio.run(self.ainvoke_many(message_batches))
+
+@st.cache_resource(show_spinner=False)
 def make_llm():
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         return None
     return GPTWrapper(api_key)
 
+@st.cache_resource(show_spinner=False)
 def load_rag():
-    # expects rag_index folder exists
-    embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-    return FAISS.load_local("rag_index", embeddings, allow_dangerous_deserialization=True)
+    # expects rag_index folder exists; llm_rag mmaps the FAISS index
+    return llm_rag.load_rag("rag_index")
 
 # =========================
 # Session init
 # =========================
-if "llm" not in st.session_state:
-    st.session_state.llm = make_llm()
+# cache_resource -> one shared LLM client + FAISS store per process (all sessions/reruns)
+llm = make_llm()
 
-if "rag_store" not in st.session_state:
-    try:
-        st.session_state.rag_store = load_rag()
-    except Exception:
-        st.session_state.rag_store = None
+try:
+    rag_store = load_rag()
+except Exception:
+    rag_store = None
 
 if "cs_session" not in st.session_state:
     st.session_state.cs_session = CustomerSession()
-    st.session_state.cs_session.rag = st.session_state.rag_store
+    st.session_state.cs_session.rag = rag_store
 
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
-# Detect language from last user message (ONLY for uploader copy)
-user_lang = _detect_user_lang(st.session_state.messages)
+# Language of the last user message, updated incrementally on submit
+# (ONLY for uploader copy) — no per-rerun scan of the whole history.
+user_lang = st.session_state.get("user_lang", "bi")
 
 # =========================
 # Sidebar: Admin Login + Admin Link
@@ -138,18 +210,26 @@ with st.sidebar:
             st.rerun()
 
     st.divider()
-    st.write("**LLM:**", "✅ connected" if st.session_state.llm else "❌ missing OPENAI_API_KEY")
-    st.write("**RAG:**", "✅ loaded" if st.session_state.rag_store else "❌ not loaded")
-    from config import COMPLAINTS_FILE
-    st.sidebar.write("Complaints file:", str(COMPLAINTS_FILE))
+    st.write("**LLM:**", "✅ connected" if llm else "❌ missing OPENAI_API_KEY")
+    st.write("**RAG:**", "✅ loaded" if rag_store else "❌ not loaded")
+    st.sidebar.write("Complaints file:", _COMPLAINTS_FILE_STR)
 
 # =========================
 # Main: Customer Chat (always)
 # =========================
 st.markdown("### 💬 Customer Chat")
 
-# عرض الرسائل
-for m in st.session_state.messages:
+# عرض الرسائل — render only the last window; older history goes in an expander
+_VISIBLE_MESSAGES = 50
+
+_older = st.session_state.messages[:-_VISIBLE_MESSAGES]
+if _older:
+    with st.expander(f"Show older messages ({len(_older)})"):
+        for m in _older:
+            with st.chat_message(m["role"]):
+                st.write(m["content"])
+
+for m in st.session_state.messages[-_VISIBLE_MESSAGES:]:
     with st.chat_message(m["role"]):
         st.write(m["content"])
 
@@ -158,20 +238,8 @@ for m in st.session_state.messages:
 # =========================
 cs = st.session_state.cs_session
 
-order_status = (cs.order_data or {}).get("status", "") or ""
-cs_state = getattr(cs.state, "value", cs.state)
-
-awaiting_images = bool(getattr(cs, "awaiting_images", False))
-pending_images = (getattr(cs, "pending_image_paths", []) or [])
-
-should_show_uploader = (
-    cs_state == "verified"
-    and order_status == "delivered"
-    and awaiting_images
-    and not pending_images
-)
-
-if should_show_uploader:
+# precomputed on FSM transitions — no per-rerun derivation
+if cs.derived.should_show_uploader:
     st.markdown("### 📎 Attach Images (for damage/missing complaints)")
     st.caption(_t(
         user_lang,
@@ -189,16 +257,29 @@ if should_show_uploader:
     )
 
     if uploads:
-        saved_paths = []
-        for f in uploads:
+        def _save_upload(f) -> str:
             ext = Path(f.name).suffix.lower()
-            filename = f"{uuid.uuid4().hex}{ext}"
-            out_path = COMPLAINT_IMAGES_DIR / filename
+            uid = uuid.uuid4().hex
+            # shard by uuid prefix so no single directory accumulates
+            # thousands of inodes as complaints pile up
+            out_dir = COMPLAINT_IMAGES_DIR / uid[:2] / uid[2:4]
+            out_dir.mkdir(parents=True, exist_ok=True)
+            out_path = out_dir / f"{uid}{ext}"
+            f.seek(0)
+            # stream in 64 KB chunks instead of materializing the whole file in RAM
             with open(out_path, "wb") as w:
-                w.write(f.getbuffer())
-            saved_paths.append(str(out_path))
+                shutil.copyfileobj(f, w, length=64 * 1024)
+            return str(out_path)
+
+        if len(uploads) == 1:
+            saved_paths = [_save_upload(uploads[0])]
+        else:
+            # writes are I/O-bound; copy multiple files concurrently
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                saved_paths = list(pool.map(_save_upload, uploads))
 
         cs.pending_image_paths = saved_paths
+        cs.refresh_derived()
 
         st.success(_t(
             user_lang,
@@ -213,15 +294,19 @@ if should_show_uploader:
 prompt = st.chat_input("اكتب رسالتك هنا… / Type your message…")
 if prompt:
     st.session_state.messages.append({"role": "user", "content": prompt})
+    st.session_state.user_lang = _detect_user_lang_single(prompt)
 
-    if st.session_state.llm is None:
+    if llm is None:
         reply = "⚠️ OPENAI_API_KEY غير موجود. رجاءً ضيفه بالبيئة."
     else:
         reply = handle_customer_message(
             user_text=prompt,
             session=st.session_state.cs_session,
-            llm=st.session_state.llm
+            llm=llm
         )
 
     st.session_state.messages.append({"role": "assistant", "content": reply})
+
+    # always rerun: there is no end-of-script rerun to fall back on, so a
+    # skipped rerun would just leave this turn unrendered
     st.rerun()
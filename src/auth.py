@@ -1,8 +1,15 @@
+import hashlib
+import hmac
+
 import streamlit as st
 from config import ADMIN_USERS
 
 ROLE_ADMIN = "admin"
 
+# Hash passwords once at import; login compares digests in constant time
+# instead of a plaintext == (which short-circuits on the first wrong byte).
+_ADMIN_HASHES = {u: hashlib.sha256(p.encode("utf-8")).digest() for u, p in (ADMIN_USERS or {}).items()}
+
 
 def init_auth_state():
     if "auth" not in st.session_state:
@@ -38,8 +45,11 @@ def logout_button(label: str = "Logout"):
 
 
 def _do_login(username: str, password: str) -> bool:
-    users = ADMIN_USERS or {}
-    return (username in users) and (users[username] == password)
+    stored = _ADMIN_HASHES.get(username)
+    if stored is None:
+        return False
+    candidate = hashlib.sha256((password or "").encode("utf-8")).digest()
+    return hmac.compare_digest(stored, candidate)
 
 
 def login_ui(title: str = "🔐 Admin Login", subtitle: str = "Authorized personnel only"):
@@ -1,8 +1,93 @@
+import json
+import os
+import time
 from pathlib import Path
+import faiss
+from openai import OpenAI
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import FAISS
 
+EMBED_MODEL = "text-embedding-3-small"
+
+# Below this many chunks a flat scan is already fast; above it, switch to
+# HNSW so query cost is ~O(log N) instead of O(N·d).
+HNSW_MIN_VECTORS = 256
+HNSW_M = 32
+
+
+def _optimize_index(vector_store):
+    """
+    Re-pack the freshly built flat float32 index:
+    - int8 scalar quantization (SQ8) -> 4x fewer bytes scanned per query
+    - HNSW graph on top once the KB is big enough for ANN to pay off
+    Vector order is preserved, so index_to_docstore_id stays valid.
+    """
+    flat = vector_store.index
+    if flat.ntotal == 0:
+        return vector_store
+
+    vectors = flat.reconstruct_n(0, flat.ntotal)
+
+    if flat.ntotal < HNSW_MIN_VECTORS:
+        index = faiss.IndexScalarQuantizer(flat.d, faiss.ScalarQuantizer.QT_8bit)
+    else:
+        index = faiss.IndexHNSWSQ(flat.d, faiss.ScalarQuantizer.QT_8bit, HNSW_M)
+
+    index.train(vectors)
+    index.add(vectors)
+    vector_store.index = index
+    return vector_store
+
+
+def _embed_via_batch_api(texts):
+    """
+    Embed chunks through the OpenAI Batch API (50% cheaper, up to 24h
+    turnaround) — for offline/CI builds, enabled with RAG_USE_BATCH_API=1.
+    """
+    client = OpenAI()
+
+    payload = "\n".join(
+        json.dumps({
+            "custom_id": str(i),
+            "method": "POST",
+            "url": "/v1/embeddings",
+            "body": {"model": EMBED_MODEL, "input": text},
+        })
+        for i, text in enumerate(texts)
+    ).encode("utf-8")
+
+    upload = client.files.create(file=("rag_embeddings.jsonl", payload), purpose="batch")
+    batch = client.batches.create(
+        input_file_id=upload.id,
+        endpoint="/v1/embeddings",
+        completion_window="24h",
+    )
+
+    # poll with exponential backoff until the batch finishes
+    delay = 5
+    while True:
+        batch = client.batches.retrieve(batch.id)
+        if batch.status == "completed":
+            break
+        if batch.status in ("failed", "expired", "cancelled"):
+            raise RuntimeError(f"Embedding batch {batch.id} ended with status: {batch.status}")
+        time.sleep(delay)
+        delay = min(delay * 2, 300)
+
+    content = client.files.content(batch.output_file_id).content
+    vectors = [None] * len(texts)
+    for line in content.splitlines():
+        if not line.strip():
+            continue
+        row = json.loads(line)
+        vectors[int(row["custom_id"])] = row["response"]["body"]["data"][0]["embedding"]
+
+    missing = sum(1 for v in vectors if v is None)
+    if missing:
+        raise RuntimeError(f"Embedding batch {batch.id} is missing {missing} vectors")
+    return vectors
+
 
 def build_rag_index():
     kb_path = Path("data/knowledge_base.txt")
@@ -20,15 +105,24 @@ def build_rag_index():
     documents = splitter.create_documents([text])
 
     embeddings = OpenAIEmbeddings(
-        model="text-embedding-3-small"
+        model=EMBED_MODEL,
+        chunk_size=2048,   # embed up to 2048 chunks per API request instead of the 1000 default
+        max_retries=3,
     )
 
-    vector_store = FAISS.from_documents(documents, embeddings)
+    if os.getenv("RAG_USE_BATCH_API") == "1":
+        texts = [d.page_content for d in documents]
+        vectors = _embed_via_batch_api(texts)
+        vector_store = FAISS.from_embeddings(zip(texts, vectors), embeddings)
+    else:
+        vector_store = FAISS.from_documents(documents, embeddings)
+    vector_store = _optimize_index(vector_store)
 
     vector_store.save_local("rag_index")
 
     print("✅ RAG index built successfully.")
     print(f"📄 Chunks created: {len(documents)}")
+    print(f"🧭 Index type: {type(vector_store.index).__name__}")
 
 
 if __name__ == "__main__":
@@ -1,6 +1,12 @@
 import json
-from datetime import datetime
-from pathlib import Path
+import threading
+
+try:
+    import orjson  # 3-10x faster (de)serialization, UTF-8 native
+except ImportError:
+    orjson = None
+import time
+from contextlib import contextmanager
 from typing import Any, Dict, List, Optional
 import os
 import uuid
@@ -8,26 +14,105 @@ import uuid
 from config import COMPLAINTS_FILE
 
 
+# Complaints are stored append-only as JSONL (one record per line, last line
+# per complaint_id wins), so creating/updating a complaint is a single append
+# instead of a full-file rewrite. The file is compacted (rewritten with only
+# the live rows) once superseded lines exceed _COMPACT_RATIO of the file.
+_LEGACY_COMPLAINTS_JSON = COMPLAINTS_FILE.with_suffix(".json")
+_COMPACT_RATIO = 0.25
+
+# In-memory cache of the parsed complaints list, invalidated by file mtime
+# so the file is only re-parsed when it actually changes on disk.
+# by_id is a parallel index so get/update are O(1) instead of a linear scan.
+# lines counts physical JSONL lines (for the compaction trigger).
+_CACHE: Dict[str, Any] = {"mtime": None, "rows": [], "by_id": {}, "lines": 0}
+_CACHE_LOCK = threading.RLock()
+_BATCH_DEPTH = 0
+_BATCH_DIRTY = False
+
+
 def _now_iso() -> str:
-    return datetime.now().isoformat(timespec="seconds")
+    # same second-resolution ISO shape as before, without building
+    # a datetime object on every mutation
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime())
 
 
 def _ensure_parent():
     COMPLAINTS_FILE.parent.mkdir(parents=True, exist_ok=True)
 
 
+def _loads(payload):
+    if orjson is not None:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+
+def _migrate_legacy_json() -> List[Dict[str, Any]]:
+    """One-time migration from the old complaints.json whole-file format."""
+    try:
+        raw = _loads(_LEGACY_COMPLAINTS_JSON.read_bytes())
+    except Exception as e:
+        print("ERROR: Failed to read legacy complaints file:", _LEGACY_COMPLAINTS_JSON, "err:", repr(e))
+        return []
+    rows = _normalize_to_list(raw)
+    _save_list(rows)
+    return rows
+
+
 def _load_raw() -> Any:
+    with _CACHE_LOCK:
+        if _BATCH_DIRTY:
+            # unflushed rows from batch_writes() are the latest state
+            return _CACHE["rows"]
     if not COMPLAINTS_FILE.exists():
+        if _LEGACY_COMPLAINTS_JSON.exists():
+            return _migrate_legacy_json()
         return []
     try:
-        with open(COMPLAINTS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
+        mtime = os.stat(COMPLAINTS_FILE).st_mtime_ns
+        with _CACHE_LOCK:
+            if _CACHE["mtime"] == mtime:
+                return _CACHE["rows"]
+
+        by_id: Dict[str, Dict[str, Any]] = {}
+        lines = 0
+        for line in COMPLAINTS_FILE.read_bytes().splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = _loads(line)
+            except Exception as e:
+                # مهم: لا تبلع الخطأ بصمت
+                print("ERROR: Skipping corrupt complaints line:", repr(e))
+                continue
+            if not isinstance(rec, dict) or not rec.get("complaint_id"):
+                continue
+            lines += 1
+            # last line per complaint_id wins; dict keeps first-seen order
+            by_id[rec["complaint_id"]] = rec
+
+        rows = list(by_id.values())
+        with _CACHE_LOCK:
+            _CACHE["mtime"] = mtime
+            _CACHE["rows"] = rows
+            _CACHE["by_id"] = by_id
+            _CACHE["lines"] = lines
+        return rows
     except Exception as e:
         # مهم: لا تبلع الخطأ بصمت
         print("ERROR: Failed to read complaints file:", COMPLAINTS_FILE, "err:", repr(e))
         return []
 
 
+def _index_by_id(rows: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    return {
+        c.get("complaint_id"): c
+        for c in rows
+        if isinstance(c, dict) and c.get("complaint_id")
+    }
+
+
 def _normalize_to_list(raw: Any) -> List[Dict[str, Any]]:
     if raw is None:
         return []
@@ -38,21 +123,100 @@ def _normalize_to_list(raw: Any) -> List[Dict[str, Any]]:
     return []
 
 
-def _atomic_write_json(path: Path, data: Any) -> None:
+def _dump_line(rec: Dict[str, Any]) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(rec, option=orjson.OPT_NON_STR_KEYS) + b"\n"
+    return (json.dumps(rec, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def _flush(rows: List[Dict[str, Any]]) -> None:
+    """Compaction: rewrite the JSONL file with only the live rows."""
     _ensure_parent()
-    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp = COMPLAINTS_FILE.with_suffix(COMPLAINTS_FILE.suffix + ".tmp")
 
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    with open(tmp, "wb") as f:
+        for rec in rows:
+            f.write(_dump_line(rec))
         f.flush()
         os.fsync(f.fileno())
 
     # replace atomic على أغلب الأنظمة
-    tmp.replace(path)
+    tmp.replace(COMPLAINTS_FILE)
+    with _CACHE_LOCK:
+        _CACHE["mtime"] = os.stat(COMPLAINTS_FILE).st_mtime_ns
+        _CACHE["lines"] = len(rows)
+
+
+def _append_row(rec: Dict[str, Any]) -> None:
+    """Append-only write path: one fsynced line per create/update."""
+    _ensure_parent()
+    with open(COMPLAINTS_FILE, "ab") as f:
+        f.write(_dump_line(rec))
+        f.flush()
+        os.fsync(f.fileno())
+    with _CACHE_LOCK:
+        _CACHE["mtime"] = os.stat(COMPLAINTS_FILE).st_mtime_ns
+        _CACHE["lines"] += 1
+
+
+def _maybe_compact() -> None:
+    with _CACHE_LOCK:
+        lines = _CACHE["lines"]
+        rows = _CACHE["rows"]
+        superseded = lines - len(rows)
+    if lines and superseded > lines * _COMPACT_RATIO:
+        _flush(rows)
 
 
 def _save_list(rows: List[Dict[str, Any]]) -> None:
-    _atomic_write_json(COMPLAINTS_FILE, rows)
+    """Full replace (compacting write) — used for bulk rewrites."""
+    global _BATCH_DIRTY
+    with _CACHE_LOCK:
+        _CACHE["rows"] = rows
+        _CACHE["by_id"] = _index_by_id(rows)
+        if _BATCH_DEPTH > 0:
+            # inside batch_writes(): flush once on exit
+            _BATCH_DIRTY = True
+            return
+    _flush(rows)
+
+
+def _record_mutation(rec: Dict[str, Any], rows: Optional[List[Dict[str, Any]]] = None) -> None:
+    """Single-record write: append a line, or defer inside batch_writes()."""
+    global _BATCH_DIRTY
+    with _CACHE_LOCK:
+        if rows is not None:
+            _CACHE["rows"] = rows
+        _CACHE["by_id"][rec["complaint_id"]] = rec
+        if _BATCH_DEPTH > 0:
+            _BATCH_DIRTY = True
+            return
+    _append_row(rec)
+    _maybe_compact()
+
+
+@contextmanager
+def batch_writes():
+    """
+    Defer disk writes for bulk updates:
+        with batch_writes():
+            update_complaint(...)  # many times
+    The file is written once on exit instead of once per mutation.
+    """
+    global _BATCH_DEPTH, _BATCH_DIRTY
+    with _CACHE_LOCK:
+        _BATCH_DEPTH += 1
+    try:
+        yield
+    finally:
+        with _CACHE_LOCK:
+            _BATCH_DEPTH -= 1
+            flush_needed = (_BATCH_DEPTH == 0 and _BATCH_DIRTY)
+            if flush_needed:
+                _BATCH_DIRTY = False
+                rows = _CACHE["rows"]
+        if flush_needed:
+            _flush(rows)
 
 
 def list_complaints() -> List[Dict[str, Any]]:
@@ -61,8 +225,9 @@ def list_complaints() -> List[Dict[str, Any]]:
 
 
 def get_complaint(complaint_id: str) -> Optional[Dict[str, Any]]:
-    rows = list_complaints()
-    return next((c for c in rows if c.get("complaint_id") == complaint_id), None)
+    list_complaints()  # refresh cache if the file changed
+    with _CACHE_LOCK:
+        return _CACHE["by_id"].get(complaint_id)
 
 
 def create_complaint_record(
@@ -76,7 +241,7 @@ def create_complaint_record(
     rows = list_complaints()
 
     # تجنب تصادم بنفس الثانية
-    complaint_id = f"CMP-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    complaint_id = f"CMP-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
 
     rec = {
         "complaint_id": complaint_id,
@@ -96,16 +261,17 @@ def create_complaint_record(
     print("DEBUG: COMPLAINTS_FILE =", COMPLAINTS_FILE)
 
     rows.append(rec)
-    _save_list(rows)
+    _record_mutation(rec, rows)
     return rec
 
 
 def update_complaint(complaint_id: str, patch: Dict[str, Any]) -> bool:
-    rows = list_complaints()
-    for c in rows:
-        if c.get("complaint_id") == complaint_id:
-            c.update(patch or {})
-            c["updated_at"] = _now_iso()
-            _save_list(rows)
-            return True
-    return False
+    list_complaints()  # refresh the cache before the by_id lookup
+    with _CACHE_LOCK:
+        c = _CACHE["by_id"].get(complaint_id)
+    if c is None:
+        return False
+    c.update(patch or {})
+    c["updated_at"] = _now_iso()
+    _record_mutation(c)
+    return True
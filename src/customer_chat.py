@@ -1,9 +1,10 @@
+import asyncio
 import os
-from openai import OpenAI
-
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import FAISS
+import time
+import weakref
+from openai import OpenAI, AsyncOpenAI, APIConnectionError, APITimeoutError, RateLimitError
 
+import llm_rag
 from customer_flow import CustomerSession, handle_customer_message
 
 
@@ -20,17 +21,81 @@ def load_llm():
     return client
 
 
+_LLM_RETRY_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError)
+_LLM_MAX_ATTEMPTS = 3
+_LLM_MAX_CONCURRENCY = 10
+
+
 class GPTWrapper:
     def __init__(self, client):
         self.client = client
-
-    def invoke(self, messages):
-        response = self.client.chat.completions.create(
-            model="gpt-4.1",
-            messages=messages,
-            temperature=0.3
-        )
-        return response.choices[0].message
+        self.aclient = AsyncOpenAI(api_key=client.api_key)
+        # asyncio.Semaphore binds to the first loop that waits on it, and
+        # invoke_many spins a fresh loop per call, so keep one per loop
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _loop_semaphore(self):
+        loop = asyncio.get_running_loop()
+        sem = self._semaphores.get(loop)
+        if sem is None:
+            sem = self._semaphores.setdefault(loop, asyncio.Semaphore(_LLM_MAX_CONCURRENCY))
+        return sem
+
+    def invoke(self, messages, model=None, temperature=None):
+        for attempt in range(_LLM_MAX_ATTEMPTS):
+            try:
+                response = self.client.chat.completions.create(
+                    model=model or "gpt-4.1",
+                    messages=messages,
+                    temperature=0.3 if temperature is None else temperature
+                )
+                return response.choices[0].message
+            except _LLM_RETRY_ERRORS:
+                if attempt == _LLM_MAX_ATTEMPTS - 1:
+                    raise
+                time.sleep(2 ** attempt)
+
+    def stream(self, messages, model=None, temperature=None):
+        # yields text deltas as they arrive; retries only apply before the
+        # first chunk (a stream that dies mid-flight surfaces to the caller)
+        for attempt in range(_LLM_MAX_ATTEMPTS):
+            try:
+                chunks = self.client.chat.completions.create(
+                    model=model or "gpt-4.1",
+                    messages=messages,
+                    temperature=0.3 if temperature is None else temperature,
+                    stream=True
+                )
+                break
+            except _LLM_RETRY_ERRORS:
+                if attempt == _LLM_MAX_ATTEMPTS - 1:
+                    raise
+                time.sleep(2 ** attempt)
+        for chunk in chunks:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                yield delta
+
+    async def ainvoke(self, messages, model=None, temperature=None):
+        async with self._loop_semaphore():
+            for attempt in range(_LLM_MAX_ATTEMPTS):
+                try:
+                    response = await self.aclient.chat.completions.create(
+                        model=model or "gpt-4.1",
+                        messages=messages,
+                        temperature=0.3 if temperature is None else temperature
+                    )
+                    return response.choices[0].message
+                except _LLM_RETRY_ERRORS:
+                    if attempt == _LLM_MAX_ATTEMPTS - 1:
+                        raise
+                    await asyncio.sleep(2 ** attempt)
+
+    async def ainvoke_many(self, message_batches):
+        return await asyncio.gather(*(self.ainvoke(m) for m in message_batches))
+
+    def invoke_many(self, message_batches):
+        return asyncio.run(self.ainvoke_many(message_batches))
 
 
 # ============================================================
@@ -38,14 +103,8 @@ class GPTWrapper:
 # ============================================================
 
 def load_rag():
-    embeddings = OpenAIEmbeddings(
-        model="text-embedding-3-small"
-    )
-    return FAISS.load_local(
-        "rag_index",
-        embeddings,
-        allow_dangerous_deserialization=True
-    )
+    # shared mmap-backed loader (cached per process)
+    return llm_rag.load_rag("rag_index")
 
 
 
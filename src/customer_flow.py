@@ -1,9 +1,39 @@
 import json
+import os
 import re
+from collections import OrderedDict, deque
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
 from enum import Enum
 from typing import Optional, Dict, List, Any
+try:
+    import numpy as np  # ships with faiss/langchain; used for the semantic cache
+except ImportError:
+    np = None
+
+try:
+    import orjson  # UTF-8-native and much faster for the per-call context dump
+except ImportError:
+    orjson = None
+
 from complaint_manager import create_complaint_record
+from intents import (
+    classify_text,
+    extract_digits,
+    is_escalation_request,
+    is_general_complaint,
+    is_order_intent,
+    is_policy_intent,
+    is_post_delivery_complaint,
+    is_system_probe,
+    is_yes,
+    looks_like_order_id,
+    looks_like_phone,
+    user_says_dont_know_order,
+)
 from order_manager import _load_orders, find_orders_by_phone, normalize_phone
+from replies import format_order_list, reply_for
 
 # ============================================================
 # Conversation States (FSM)
@@ -18,21 +48,73 @@ class State(str, Enum):
 # Session Object
 # ============================================================
 
+@dataclass(slots=True, frozen=True)
+class OrderSnapshot:
+    """Immutable view of the verified order this session talks about."""
+    order_id: str = ""
+    customer_name: str = ""
+    status: str = ""
+    last_updated: str = ""
+    phone: str = ""
+
+
+@dataclass
+class DerivedState:
+    """
+    Snapshot of the session facts the UI reads on every rerun.
+    Recomputed only when the FSM handles a message (or the UI attaches
+    images), so app.py does plain attribute reads instead of re-deriving.
+    """
+    state_value: str = State.IDLE.value
+    order_status: str = ""
+    awaiting_images: bool = False
+    pending_count: int = 0
+    should_show_uploader: bool = False
+
+
+# Long sessions only ever feed the last ~10 turns to the LLM; a bounded
+# deque keeps memory flat instead of growing with the whole conversation.
+_CHAT_HISTORY_MAX = 64
+
+
+@dataclass(slots=True)
 class CustomerSession:
-    def __init__(self):
-        self.state: State = State.IDLE
-        self.order_id: Optional[str] = None
-        self.order_data: Optional[Dict[str, Any]] = None
-        self.rag = None
-        self.matched_orders: List[str] = []
-        self.language: Optional[str] = None  # "ar" or "en"
-        self.chat_history: List[Dict[str, str]] = []
-        self.awaiting_images: bool = False
-        self.verify_prompt_count: int = 0
-        # Keep last described issue + pending images (from UI)
-        self.last_issue_text: Optional[str] = None
-        self.pending_image_paths: List[str] = []
-        self.awaiting_complaint_confirmation: bool = False
+    state: State = State.IDLE
+    order_id: Optional[str] = None
+    order_data: Optional[OrderSnapshot] = None
+    rag: Any = None
+    matched_orders: List[str] = field(default_factory=list)
+    language: Optional[str] = None  # "ar" or "en"
+    chat_history: deque = field(default_factory=lambda: deque(maxlen=_CHAT_HISTORY_MAX))
+    awaiting_images: bool = False
+    verify_prompt_count: int = 0
+    # Keep last described issue + pending images (from UI)
+    last_issue_text: Optional[str] = None
+    pending_image_paths: List[str] = field(default_factory=list)
+    # (normalized_phone, matches) memo scoped to the current turn, so the
+    # AWAITING_ORDER_ID -> AWAITING_PHONE hop doesn't look up the same
+    # number twice; reset at the start of every turn
+    last_phone_lookup: Optional[tuple] = None
+    awaiting_complaint_confirmation: bool = False
+    derived: DerivedState = field(default_factory=DerivedState)
+
+    def refresh_derived(self):
+        state_value = getattr(self.state, "value", self.state)
+        order_status = self.order_data.status if self.order_data else ""
+        awaiting_images = bool(self.awaiting_images)
+        pending_count = len(self.pending_image_paths or [])
+        self.derived = DerivedState(
+            state_value=state_value,
+            order_status=order_status,
+            awaiting_images=awaiting_images,
+            pending_count=pending_count,
+            should_show_uploader=(
+                state_value == "verified"
+                and order_status == "delivered"
+                and awaiting_images
+                and pending_count == 0
+            ),
+        )
 
     def add_turn(self, role: str, content: str):
         if not content:
@@ -42,23 +124,19 @@ class CustomerSession:
     def recent_history(self, max_turns: int = 10) -> List[Dict[str, str]]:
         if max_turns <= 0:
             return []
-        return self.chat_history[-max_turns:]
+        skip = max(len(self.chat_history) - max_turns, 0)
+        return list(islice(self.chat_history, skip, None))
 
 
 # ============================================================
 # Helpers
 # ============================================================
 
-def extract_digits(text: str) -> str:
-    return re.sub(r"\D", "", (text or ""))
+# Keyword patterns and per-message classifiers live in intents.py;
+# only language detection needs its own character classes here.
+_ARABIC_RE = re.compile(r"[\u0600-\u06FF]")
+_LATIN_RE = re.compile(r"[A-Za-z]")
 
-def looks_like_phone(text: str) -> bool:
-    d = extract_digits(text)
-    return 9 <= len(d) <= 15
-
-def looks_like_order_id(text: str) -> bool:
-    t = (text or "").strip().upper()
-    return t.startswith("ORD-") and len(t) >= 6
 
 def detect_language(text: str) -> Optional[str]:
     t = (text or "").strip()
@@ -70,71 +148,106 @@ def detect_language(text: str) -> Optional[str]:
         return None
 
     # Arabic?
-    if re.search(r"[\u0600-\u06FF]", t):
+    if _ARABIC_RE.search(t):
         return "ar"
 
     # English letters?
-    if re.search(r"[A-Za-z]", t):
+    if _LATIN_RE.search(t):
         return "en"
 
     return None
 
-def user_says_dont_know_order(text: str) -> bool:
-    t = (text or "").strip().lower()
-    arabic = ["ما بعرف", "مش عارف", "ما عندي رقم", "نسيت رقم", "مش متذكر", "ما بتذكر", "ما معي رقم"]
-    english = ["don't know", "do not know", "no order id", "forgot", "i don't remember"]
-    return any(p in t for p in arabic + english)
+# Cache RAG lookups so repeated questions skip the OpenAI embedding call.
+# Two layers: final context string per query, and the query embedding itself
+# (so near-term repeats can search by vector without re-embedding).
+_RAG_RESULT_CACHE: "OrderedDict[tuple, str]" = OrderedDict()
+_RAG_EMBED_CACHE: "OrderedDict[str, list]" = OrderedDict()
+_RAG_CACHE_MAX = 512
+
+# Paraphrased repeats ("where is my order" / "where's my order?") rarely hit
+# the exact-string cache, so after embedding we also accept the cached context
+# of the nearest previously seen query when cosine similarity is this high.
+_SEMANTIC_SIM_THRESHOLD = 0.95
+
+
+def _cache_put(cache: OrderedDict, key, value):
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > _RAG_CACHE_MAX:
+        cache.popitem(last=False)
+
+
+# Shared worker pool: embedding + FAISS work runs off the per-session script
+# thread, so concurrent sessions queue on these workers instead of blocking
+# each other's renders.
+_RAG_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="rag")
+
+
+def _semantic_lookup(vec, rag_id) -> Optional[str]:
+    if np is None or not _RAG_EMBED_CACHE:
+        return None
+    keys = list(_RAG_EMBED_CACHE.keys())
+    mat = np.asarray(list(_RAG_EMBED_CACHE.values()), dtype="float32")
+    q = np.asarray(vec, dtype="float32")
+    denom = np.linalg.norm(mat, axis=1) * np.linalg.norm(q)
+    denom[denom == 0] = 1.0
+    sims = (mat @ q) / denom
+    best = int(np.argmax(sims))
+    if sims[best] >= _SEMANTIC_SIM_THRESHOLD:
+        return _RAG_RESULT_CACHE.get((keys[best], rag_id))
+    return None
+
 
 def retrieve_knowledge(query: str, rag_store) -> str:
     if not rag_store:
         return ""
-    docs = rag_store.similarity_search(query, k=3)
-    return "\n".join(d.page_content for d in docs)
-
-def is_policy_intent(text: str) -> bool:
-    t = (text or "").strip().lower()
-    keywords_ar = ["سياسة", "سياسات", "استرجاع", "ارجاع", "إرجاع", "استبدال", "ضمان", "خصوصية", "شروط", "توصيل", "استرداد"]
-    keywords_en = ["policy", "refund", "return", "exchange", "warranty", "privacy", "terms", "delivery"]
-    # ✅ must be a specific policy question (avoid "tell me all policies")
-    has_keyword = any(k in t for k in keywords_ar + keywords_en)
-
-    too_generic = any(x in t for x in [
-        "all policies", "your policies", "policies list", "what are the policies",
-        "كل السياسات", "اعطيني السياسات", "سياساتك", "شو السياسات"
-    ])
-
-    return has_keyword and not too_generic
-
-
-def is_order_intent(text: str) -> bool:
-    t = (text or "").strip().lower()
-    keywords_ar = ["طلبي", "طلبيتي", "طلب", "رقم الطلب", "تتبع", "وين طلبي", "تاخر", "تأخر", "توصيل", "شحنة", "مندوب", "سائق"]
-    keywords_en = ["order", "track", "tracking", "delivery", "delayed", "shipment", "courier", "driver"]
-    return (
-        any(k in t for k in keywords_ar + keywords_en)
-        or looks_like_order_id(text)
-        or looks_like_phone(text)
-    )
+    return _RAG_POOL.submit(_retrieve_knowledge, query, rag_store).result()
+
+
+def _rag_result(future) -> str:
+    """Block on the early-submitted RAG lookup only when a branch needs it."""
+    return future.result() if future is not None else ""
+
+
+def _retrieve_knowledge(query: str, rag_store) -> str:
+    norm = (query or "").strip().lower()
+    key = (norm, id(rag_store))
+
+    cached = _RAG_RESULT_CACHE.get(key)
+    if cached is not None:
+        _RAG_RESULT_CACHE.move_to_end(key)
+        return cached
+
+    vec = _RAG_EMBED_CACHE.get(norm)
+    if vec is not None:
+        docs = rag_store.similarity_search_by_vector(vec, k=3)
+    else:
+        try:
+            vec = rag_store.embeddings.embed_query(query)
+        except Exception:
+            vec = None
+        if vec is not None:
+            # check near-duplicates of earlier queries before touching FAISS
+            near = _semantic_lookup(vec, id(rag_store))
+            _cache_put(_RAG_EMBED_CACHE, norm, vec)
+            if near is not None:
+                _cache_put(_RAG_RESULT_CACHE, key, near)
+                return near
+            docs = rag_store.similarity_search_by_vector(vec, k=3)
+        else:
+            docs = rag_store.similarity_search(query, k=3)
+
+    context = "\n".join(d.page_content for d in docs)
+    _cache_put(_RAG_RESULT_CACHE, key, context)
+    return context
+
+def _lookup_orders_by_phone(session: CustomerSession, phone: str) -> List[str]:
+    if session.last_phone_lookup and session.last_phone_lookup[0] == phone:
+        return session.last_phone_lookup[1]
+    matches = find_orders_by_phone(phone)
+    session.last_phone_lookup = (phone, matches)
+    return matches
 
-def is_escalation_request(text: str) -> bool:
-    t = (text or "").strip().lower()
-    ar = [
-    "مدير", "مسؤول", "المسؤول", "الإدارة", "تصعيد",
-    "اشكي", "شكوى", "ارفع شكوى", "ارفعها", "شكيت",
-    "بدي حد مسؤول", "بدي المسؤول", "حولني لمسؤول"
-    ]
-    en = [
-    "manager", "supervisor", "escalate",
-    "complaint", "raise a complaint",
-    "responsible", "person in charge", "someone in charge",
-    "boss", "team lead", "support lead"
-    ]
-
-    return any(k in t for k in ar + en)
-
-def is_yes(text: str) -> bool:
-    t = (text or "").strip().lower()
-    return t in ["نعم", "اه", "آه", "ايوه", "اي", "yes", "yep", "yeah", "ok", "تمام", "تم", "تأكيد", "أكد", "confirm"]
 
 def last_assistant_asked_escalation(session: CustomerSession) -> bool:
     for m in reversed(session.chat_history):
@@ -143,54 +256,26 @@ def last_assistant_asked_escalation(session: CustomerSession) -> bool:
             return ("تصعيد" in a) or ("مسؤول" in a) or ("الإدارة" in a) or ("manager" in a) or ("escalat" in a)
     return False
 
-def is_system_probe(text: str) -> bool:
-    t = (text or "").strip().lower()
-
-    probes_ar = [
-        "برومبت", "البرومبت", "تعليماتك", "قواعدك", "كيف بتشتغل", "كيف تعمل",
-        "السيستم", "منطقك", "آلية عملك",
-        "ايش السياسات", "إيش السياسات", "شو السياسات", "السياسات اللي عندك",
-        "اعطيني السياسات", "هات السياسات", "سياساتك", "سياسة النظام", "سياسات النظام"
-    ]
-    probes_en = [
-        "prompt", "system prompt", "your prompt", "instructions", "your rules",
-        "internal rules", "how do you work", "tell me your policies", "all policies","tell me all policies"
-    ]
-
-    return any(p in t for p in probes_ar + probes_en)
-
-
 def empathy_prefix(lang: str) -> str:
     if lang == "en":
         return "I understand how frustrating this can be 🙏\n"
     return "أفهم قدّيش الموقف مزعج 🙏\n"
 
-# ============================================================
-# Complaint classifiers (verified stage)
-# ============================================================
-
-def is_post_delivery_complaint(text: str) -> bool:
-    t = (text or "").lower()
-    ar = ["تلف", "مكسور", "خربان", "ناقص", "تالف", "فتح", "مفتوح", "وصلني غلط", "منتج غلط", "غلط بالطلب", "مشكلة بالمنتج"]
-    en = ["damage", "damaged", "broken", "missing", "defect", "opened", "wrong item", "wrong product"]
-    return any(k in t for k in ar + en)
-
-def is_general_complaint(text: str) -> bool:
-    t = (text or "").lower()
-    ar = [
-        "تأخير", "تاخير", "تاخر", "تأخر", "متأخر",
-        "سوء", "تعامل", "مندوب", "سائق", "درايفر",
-        "مش محترم", "وقح", "اسلوب", "خدمة سيئة", "توصيل سيء"
-    ]
-    en = ["delay", "late", "bad service", "rude", "courier", "driver", "behavior", "attitude"]
-    return any(k in t for k in ar + en)
-
-
 # ============================================================
 # Core Entry Point
 # ============================================================
 
 def handle_customer_message(user_text: str, session: CustomerSession, llm) -> str:
+    # the phone-lookup memo only spans a single turn; a number re-sent on a
+    # later turn must see orders created or fixed in the meantime
+    session.last_phone_lookup = None
+    reply = _handle_customer_message(user_text, session, llm)
+    # one refresh per turn keeps session.derived in sync for the UI
+    session.refresh_derived()
+    return reply
+
+
+def _handle_customer_message(user_text: str, session: CustomerSession, llm) -> str:
     user_text = (user_text or "").strip()
     if not user_text:
         return ""
@@ -199,6 +284,9 @@ def handle_customer_message(user_text: str, session: CustomerSession, llm) -> st
     if looks_like_order_id(user_text):
         user_text = user_text.strip().upper()
 
+    # One pass over all keyword patterns; the branches below read flags
+    intents = classify_text(user_text)
+
     # Lock language from first meaningful message
     if session.language is None:
         lang = detect_language(user_text)
@@ -206,23 +294,18 @@ def handle_customer_message(user_text: str, session: CustomerSession, llm) -> st
             session.language = lang
 
     orders = _load_orders()
-    rag_context = retrieve_knowledge(user_text, session.rag)
+
+    # Kick retrieval off immediately so embedding + FAISS overlap with the
+    # routing below; deterministic branches reply without ever waiting on it.
+    rag_future = _RAG_POOL.submit(_retrieve_knowledge, user_text, session.rag) if session.rag else None
 
     # Always store user message in memory
     session.add_turn("user", user_text)
     
 
     # 🔒 Block prompt / system probing (NO LLM)
-    if is_system_probe(user_text):
-        reply_ar = (
-            "أقدر أساعدك بالأسئلة المتعلقة بالطلبات والخدمات (مثل التوصيل، الإرجاع، الاسترجاع).\n"
-            "إذا عندك سؤال محدد عن سياسة معينة، اسألني عنها مباشرة."
-        )
-        reply_en = (
-            "I can help with customer-related questions (delivery, returns, refunds).\n"
-            "If you have a specific policy question, please ask it directly."
-        )
-        reply = reply_en if session.language == "en" else reply_ar
+    if intents.system_probe:
+        reply = reply_for("system_probe", session.language)
         session.add_turn("assistant", reply)
         return reply
 
@@ -230,22 +313,11 @@ def handle_customer_message(user_text: str, session: CustomerSession, llm) -> st
     # GLOBAL: Escalation request BEFORE verification
     # Prevent LLM from claiming "recorded" while not saved
     # ========================================================
-    if session.state != State.VERIFIED and is_escalation_request(user_text):
+    if session.state != State.VERIFIED and intents.escalation:
         session.last_issue_text = user_text
         session.state = State.AWAITING_ORDER_ID
 
-        reply_ar = (
-            empathy_prefix("ar") +
-            "حتى أقدر أتابع الشكوى بشكل صحيح، محتاج رقم الطلب (ORD-001) "
-            "أو رقم هاتفك إذا ما بتذكر رقم الطلب."
-        )
-
-        reply_en = (
-            empathy_prefix("en") +
-            "To proceed with your complaint, I need your Order ID (ORD-001) "
-            "or your phone number if you don’t remember it."
-        )
-        reply = reply_ar if session.language != "en" else reply_en
+        reply = reply_for("escalation_need_order", session.language)
 
         session.add_turn("assistant", reply)
         return reply
@@ -254,23 +326,23 @@ def handle_customer_message(user_text: str, session: CustomerSession, llm) -> st
     # STATE: IDLE
     # ========================================================
     if session.state == State.IDLE:
-        if is_policy_intent(user_text) and not is_order_intent(user_text):
+        if intents.policy and not intents.order:
             reply = generate_llm_reply(
                 llm,
                 State.IDLE,
-                {"verified": False, "knowledge": rag_context, "language": session.language},
+                {"verified": False, "knowledge": _rag_result(rag_future), "language": session.language},
                 user_text,
                 session.recent_history(10),
             )
             session.add_turn("assistant", reply)
             return reply
 
-        if is_order_intent(user_text):
+        if intents.order:
             session.state = State.AWAITING_ORDER_ID
             reply = generate_llm_reply(
                 llm,
                 State.AWAITING_ORDER_ID,
-                {"verified": False, "knowledge": rag_context, "language": session.language},
+                {"verified": False, "knowledge": _rag_result(rag_future), "language": session.language},
                 user_text,
                 session.recent_history(10),
             )
@@ -280,7 +352,7 @@ def handle_customer_message(user_text: str, session: CustomerSession, llm) -> st
         reply = generate_llm_reply(
             llm,
             State.IDLE,
-            {"verified": False, "knowledge": rag_context, "language": session.language},
+            {"verified": False, "knowledge": _rag_result(rag_future), "language": session.language},
             user_text,
             session.recent_history(10),
         )
@@ -291,6 +363,9 @@ def handle_customer_message(user_text: str, session: CustomerSession, llm) -> st
     # STATE: AWAITING ORDER ID
     # ========================================================
     if session.state == State.AWAITING_ORDER_ID:
+        # Each LLM branch only fills `extra`; a single tail call below builds
+        # the context and talks to the model, so retries/caching wrap one site.
+        extra: Optional[Dict[str, Any]] = None
 
         # If user selects matched order
         if session.matched_orders and user_text in session.matched_orders:
@@ -304,10 +379,7 @@ def handle_customer_message(user_text: str, session: CustomerSession, llm) -> st
                 session.matched_orders = []
                 session.verify_prompt_count = 0  # ✅ reset
 
-                reply = reply_en if session.language == "en" else reply_ar
-                reply = "❌ الطلب المختار غير موجود. جرّب رقم طلب آخر أو اكتب رقم هاتفك مرة ثانية."
-                if session.language == "en":
-                    reply = "❌ The selected order was not found. Please try another Order ID or type your phone number again."
+                reply = reply_for("selected_order_missing", session.language)
                 session.add_turn("assistant", reply)
                 return reply
 
@@ -315,155 +387,102 @@ def handle_customer_message(user_text: str, session: CustomerSession, llm) -> st
             # ✅ Require phone after selecting order
             session.state = State.AWAITING_PHONE
             session.matched_orders = []
-            session.order_data = {
-                "order_id": session.order_id,
-                "customer_name": order.get("customer_name", ""),
-                "status": order.get("status", ""),
-                "last_updated": order.get("last_updated", ""),
-                "phone": order.get("phone", ""),
-            }
-
-            reply = generate_llm_reply(
-                llm, State.AWAITING_PHONE,
-                {"verified": False, "order_exists": True, "knowledge": rag_context, "language": session.language},
-                user_text,
-                session.recent_history(10),
+            session.order_data = OrderSnapshot(
+                order_id=session.order_id,
+                customer_name=order.get("customer_name", ""),
+                status=order.get("status", ""),
+                last_updated=order.get("last_updated", ""),
+                phone=order.get("phone", ""),
             )
-            session.add_turn("assistant", reply)
-            return reply
+
+            extra = {"order_exists": True}
 
         # Order id format but not found
-        if looks_like_order_id(user_text) and user_text not in orders:
+        elif intents.order_id_like and user_text not in orders:
             session.state = State.AWAITING_ORDER_ID
             session.order_id = None
             session.order_data = None
             session.matched_orders = []
 
-            reply_ar = "❌ رقم الطلب غير موجود. تأكد من الرقم (مثل: ORD-001) أو اكتب رقم هاتفك للبحث عن طلباتك."
-            reply_en = "❌ Order ID not found. Please check it (e.g., ORD-001) or type your phone number to find your orders."
-            reply = reply_en if session.language == "en" else reply_ar
+            reply = reply_for("order_id_not_found", session.language)
 
             session.add_turn("assistant", reply)
             return reply
 
         # user doesn't know order id
-        if user_says_dont_know_order(user_text):
+        elif intents.dont_know_order:
             session.order_id = None
             session.matched_orders = []
             session.state = State.AWAITING_PHONE
-            reply = generate_llm_reply(
-                llm, State.AWAITING_PHONE,
-                {"verified": False, "knowledge": rag_context, "language": session.language},
-                user_text,
-                session.recent_history(10),
-            )
-            session.add_turn("assistant", reply)
-            return reply
+            extra = {}
 
         # phone provided
-        if looks_like_phone(user_text):
+        elif intents.phone_like:
             phone = normalize_phone(extract_digits(user_text))
-            matches = find_orders_by_phone(phone)
+            matches = _lookup_orders_by_phone(session, phone)
 
             if not matches:
                 session.matched_orders = []
-                reply = generate_llm_reply(
-                    llm, session.state,
-                    {"verified": False, "reason": "no_order_for_phone", "knowledge": rag_context, "language": session.language},
-                    user_text,
-                    session.recent_history(10),
-                )
-                session.add_turn("assistant", reply)
-                return reply
-
-            session.matched_orders = matches
+                extra = {"reason": "no_order_for_phone"}
+            else:
+                session.matched_orders = matches
 
-            if len(matches) > 1:
-                lines = []
-                for oid in matches:
-                    o = orders.get(oid, {})
-                    lines.append(
-                        f"- {oid} | الحالة: {o.get('status', '-')}"
-                        if (session.language == "ar") else
-                        f"- {oid} | status: {o.get('status','-')}"
-                    )
-                msg_ar = "تم العثور على أكثر من طلب مرتبط برقم هاتفك:\n" + "\n".join(lines) + "\n\nمن فضلك اكتب رقم الطلب حتى أكمل مساعدتك."
-                msg_en = "We found multiple orders linked to your phone:\n" + "\n".join(lines) + "\n\nPlease type the Order ID to continue."
-                reply = msg_ar if session.language == "ar" else msg_en
-                session.add_turn("assistant", reply)
-                return reply
+                if len(matches) > 1:
+                    lines = format_order_list(matches, orders, session.language)
+                    reply = reply_for("multi_match_continue", session.language, default="en", lines=lines)
+                    session.add_turn("assistant", reply)
+                    return reply
 
-            # single match -> verify
-            session.order_id = matches[0]
-            order = orders.get(session.order_id, {})
-            session.verify_prompt_count = 0
-            session.state = State.VERIFIED
-            session.matched_orders = []
-            session.order_data = {
-                "order_id": session.order_id,
-                "customer_name": order.get("customer_name", ""),
-                "status": order.get("status", ""),
-                "last_updated": order.get("last_updated", ""),
-                "phone": order.get("phone", ""),
-            }
-            
-  
-            reply = generate_llm_reply(
-                llm, State.VERIFIED,
-                {"verified": True, "order": session.order_data, "reveal_order_id": True, "knowledge": rag_context, "language": session.language},
-                user_text,
-                session.recent_history(10),
-            )
-            session.add_turn("assistant", reply)
-            return reply
+                # single match -> verify
+                session.order_id = matches[0]
+                order = orders.get(session.order_id, {})
+                session.verify_prompt_count = 0
+                session.state = State.VERIFIED
+                session.matched_orders = []
+                session.order_data = OrderSnapshot(
+                    order_id=session.order_id,
+                    customer_name=order.get("customer_name", ""),
+                    status=order.get("status", ""),
+                    last_updated=order.get("last_updated", ""),
+                    phone=order.get("phone", ""),
+                )
+                extra = {"verified": True, "order": session.order_data, "reveal_order_id": True}
 
         # valid existing order id -> ask phone
-        if user_text in orders:
+        elif user_text in orders:
             session.order_id = user_text
             session.verify_prompt_count = 0   #Because the customer give the system order-id or phone number
             session.matched_orders = []
             session.state = State.AWAITING_PHONE
 
-            reply_ar = "تمام ✅ للتأكد من الأمان، اكتب رقم هاتفك المرتبط بالطلب."
-            reply_en = "Great ✅ For security, please type the phone number linked to the order."
-            reply = reply_en if session.language == "en" else reply_ar
+            reply = reply_for("ask_phone_for_order", session.language)
 
             session.add_turn("assistant", reply)
             return reply
         
 
-        # ✅ Stop looping: if user repeats complaint/escalation without providing ID/phone
-        if (is_escalation_request(user_text) or is_general_complaint(user_text)) and not looks_like_order_id(user_text) and not looks_like_phone(user_text):
-            session.verify_prompt_count += 1
+        if extra is None:
+            # ✅ Stop looping: if user repeats complaint/escalation without providing ID/phone
+            if (intents.escalation or intents.general_complaint) and not intents.order_id_like and not intents.phone_like:
+                session.verify_prompt_count += 1
 
-            if session.verify_prompt_count == 1:
-                reply_ar = (
-                   "أفهم إن التأخير مزعج 🙏\n"
-                    "عشان أقدر أربط الشكوى بطلبك بشكل صحيح، اكتب رقم الطلب (مثال: ORD-001) أو رقم هاتفك."
-                )
-                reply_en = (
-                    "I understand delays are frustrating 🙏\n"
-                    "To link the complaint to your order, please type your Order ID (e.g., ORD-001) or your phone number."
-                )
-            else:
-                reply_ar = (
-                    "أنا جاهز أرفع الشكوى فورًا، لكن لازم رقم الطلب أو رقم الهاتف حتى نكمل.\n"
-                    "اكتب واحد منهم من فضلك."
-                )
-                reply_en = (
-                    "I can file the complaint right away, but I need the Order ID or phone number to proceed.\n"
-                    "Please send one of them."
-                )
+                key = "need_id_first" if session.verify_prompt_count == 1 else "need_id_repeat"
+                reply = reply_for(key, session.language)
+                session.add_turn("assistant", reply)
+                return reply
 
-            reply = reply_en if session.language == "en" else reply_ar
+            # fallback (NO LLM in verification stage)
+            reply = reply_for("verify_fallback", session.language)
             session.add_turn("assistant", reply)
             return reply
 
-
-        # fallback (NO LLM in verification stage)
-        reply_ar = "اكتب رقم الطلب بصيغة (ORD-001)  أو اكتب رقم هاتفك بصيغة صحيحة لو سمحت."
-        reply_en = "Please type your Order ID in this format (ORD-001) or type your phone number in correct format please."
-        reply = reply_en if session.language == "en" else reply_ar
+        # single LLM call site for the whole state
+        reply = generate_llm_reply(
+            llm, session.state,
+            {"verified": False, "knowledge": _rag_result(rag_future), "language": session.language, **extra},
+            user_text,
+            session.recent_history(10),
+        )
         session.add_turn("assistant", reply)
         return reply
 
@@ -472,10 +491,10 @@ def handle_customer_message(user_text: str, session: CustomerSession, llm) -> st
     # STATE: AWAITING PHONE
     # ========================================================
     if session.state == State.AWAITING_PHONE:
-        if not looks_like_phone(user_text):
+        if not intents.phone_like:
             reply = generate_llm_reply(
                 llm, session.state,
-                {"verified": False, "knowledge": rag_context, "language": session.language},
+                {"verified": False, "knowledge": _rag_result(rag_future), "language": session.language},
                 user_text,
                 session.recent_history(10),
             )
@@ -483,12 +502,12 @@ def handle_customer_message(user_text: str, session: CustomerSession, llm) -> st
             return reply
 
         phone = normalize_phone(extract_digits(user_text))
-        matches = find_orders_by_phone(phone)
+        matches = _lookup_orders_by_phone(session, phone)
 
         if not matches:
             reply = generate_llm_reply(
                 llm, session.state,
-                {"verified": False, "phone_match": False, "knowledge": rag_context, "language": session.language},
+                {"verified": False, "phone_match": False, "knowledge": _rag_result(rag_future), "language": session.language},
                 user_text,
                 session.recent_history(10),
             )
@@ -498,7 +517,7 @@ def handle_customer_message(user_text: str, session: CustomerSession, llm) -> st
         if session.order_id and session.order_id not in matches:
             reply = generate_llm_reply(
                 llm, session.state,
-                {"verified": False, "phone_match": False, "knowledge": rag_context, "language": session.language},
+                {"verified": False, "phone_match": False, "knowledge": _rag_result(rag_future), "language": session.language},
                 user_text,
                 session.recent_history(10),
             )
@@ -510,18 +529,8 @@ def handle_customer_message(user_text: str, session: CustomerSession, llm) -> st
                 session.matched_orders = matches
                 session.state = State.AWAITING_ORDER_ID
 
-                lines = []
-                for oid in matches:
-                    o = orders.get(oid, {})
-                    lines.append(
-                        f"- {oid} | الحالة: {o.get('status', '-')}"
-                        if (session.language == "ar") else
-                        f"- {oid} | status: {o.get('status','-')}"
-                    )
-
-                msg_ar = "وجدنا أكثر من طلب مرتبط برقم هاتفك:\n" + "\n".join(lines) + "\n\nمن فضلك اكتب رقم الطلب المقصود."
-                msg_en = "We found multiple orders linked to your phone:\n" + "\n".join(lines) + "\n\nPlease type the intended Order ID."
-                reply = msg_ar if session.language == "ar" else msg_en
+                lines = format_order_list(matches, orders, session.language)
+                reply = reply_for("multi_match_select", session.language, default="en", lines=lines)
                 session.add_turn("assistant", reply)
                 return reply
 
@@ -530,17 +539,17 @@ def handle_customer_message(user_text: str, session: CustomerSession, llm) -> st
         order = orders.get(session.order_id, {})
         session.state = State.VERIFIED
         session.matched_orders = []
-        session.order_data = {
-            "order_id": session.order_id,
-            "customer_name": order.get("customer_name", ""),
-            "status": order.get("status", ""),
-            "last_updated": order.get("last_updated", ""),
-            "phone": order.get("phone", ""),
-        }
+        session.order_data = OrderSnapshot(
+            order_id=session.order_id,
+            customer_name=order.get("customer_name", ""),
+            status=order.get("status", ""),
+            last_updated=order.get("last_updated", ""),
+            phone=order.get("phone", ""),
+        )
 
         reply = generate_llm_reply(
             llm, State.VERIFIED,
-            {"verified": True, "order": session.order_data, "reveal_order_id": True, "knowledge": rag_context, "language": session.language},
+            {"verified": True, "order": session.order_data, "reveal_order_id": True, "knowledge": _rag_result(rag_future), "language": session.language},
             user_text,
             session.recent_history(10),
         )
@@ -551,58 +560,48 @@ def handle_customer_message(user_text: str, session: CustomerSession, llm) -> st
     # STATE: VERIFIED
     # ========================================================
     if session.state == State.VERIFIED:
+        # Hoisted once: almost every path below re-reads these
+        pending_imgs = session.pending_image_paths or []
+        last_issue = session.last_issue_text or ""
+        order_data = session.order_data
+        complaint_order_id = order_data.order_id if order_data else (session.order_id or "")
+        complaint_name = order_data.customer_name if order_data else ""
+        complaint_phone = order_data.phone if order_data else ""
 
         # لو المستخدم كتب تأكيد بدون وجود صور/شكوى معلقة
-        if is_yes(user_text) and not (session.pending_image_paths or []) and not (session.last_issue_text or ""):
-            reply_ar = "تمام ✅ إذا بدك تسجل شكوى، اكتب وصف المشكلة التي واجهتك و مستاء بسببهاأولاً."
-            reply_en = "Okay ✅ If you want to file a complaint, please describe the issue you faced and what upset you about it first."
-            reply = reply_en if session.language == "en" else reply_ar
+        if intents.yes and not pending_imgs and not last_issue:
+            reply = reply_for("confirm_without_issue", session.language)
             session.add_turn("assistant", reply)
             return reply
         
         # لو النظام منتظر صور والمستخدم كتب تأكيد بدون صور
-        if session.awaiting_images and is_yes(user_text) and not (session.pending_image_paths or []):
-            reply_ar = "تمام ✅ بس لسه ما وصلني صور. ارفق الصور من (Attach Images) وبعدها اكتب (تم/تأكيد)."
-            reply_en = "Okay ✅ but I still didn't receive any images. Attach them using (Attach Images), then type (confirm/yes)."
-            reply = reply_en if session.language == "en" else reply_ar
+        if session.awaiting_images and intents.yes and not pending_imgs:
+            reply = reply_for("confirm_without_images", session.language)
             session.add_turn("assistant", reply)
             return reply
 
 
         # Store last issue text (don't overwrite with yes/confirm)
-        if not is_yes(user_text) and not session.awaiting_complaint_confirmation:
-            session.last_issue_text = user_text
+        if not intents.yes and not session.awaiting_complaint_confirmation:
+            session.last_issue_text = last_issue = user_text
 
-        order_status = (session.order_data or {}).get("status", "")
+        order_status = order_data.status if order_data else ""
 
         # 0) General complaints (delay/service/driver) -> NO delivery / NO images      
         
-        if is_general_complaint(user_text) and not session.awaiting_complaint_confirmation:
+        if intents.general_complaint and not session.awaiting_complaint_confirmation:
             session.last_issue_text = user_text
             session.awaiting_complaint_confirmation = True
 
-            reply_ar = (
-                empathy_prefix("ar") +
-                "حبيت أوضح المشكلة 👍\n"
-                "هل حابب أسجل شكوى رسمية بخصوص التأخير؟\n"
-                "اكتب (نعم) للتأكيد أو اشرح أكثر إذا بتحب."
-            )
-            reply_en = (
-                empathy_prefix("en") +
-                "Thanks for explaining 👍\n"
-                "Would you like me to submit an official complaint about the delay?\n"
-                "Type (yes) to confirm or explain more."
-            )
-
-            reply = reply_en if session.language == "en" else reply_ar
+            reply = reply_for("general_complaint_confirm", session.language)
             session.add_turn("assistant", reply)
             return reply
         
-        if session.awaiting_complaint_confirmation and is_yes(user_text):
+        if session.awaiting_complaint_confirmation and intents.yes:
             rec = create_complaint_record(
-                order_id=session.order_data["order_id"],
-                customer_name=session.order_data["customer_name"],
-                phone=session.order_data["phone"],
+                order_id=order_data.order_id,
+                customer_name=order_data.customer_name,
+                phone=order_data.phone,
                 message=session.last_issue_text,
                 image_paths=[],
                 category="service",
@@ -611,100 +610,69 @@ def handle_customer_message(user_text: str, session: CustomerSession, llm) -> st
             session.awaiting_complaint_confirmation = False
             session.last_issue_text = None
 
-            reply_ar = f"✅ تم تسجيل الشكوى.\nرقم الشكوى: {rec['complaint_id']}"
-            reply_en = f"✅ Your complaint has been recorded.\nComplaint ID: {rec['complaint_id']}"
-
-            reply = reply_en if session.language == "en" else reply_ar
+            reply = reply_for("complaint_recorded", session.language, complaint_id=rec["complaint_id"])
             session.add_turn("assistant", reply)
             return reply
 
 
         # 1) Post-delivery complaints -> delivered + images
-        if is_post_delivery_complaint(user_text):
+        if intents.post_delivery_complaint:
             if order_status != "delivered":
-                reply = "يمكن تسجيل شكاوى التلف/النقص فقط بعد تسليم الطلب."
-                if session.language == "en":
-                    reply = "Damage/missing complaints can only be submitted after delivery."
+                reply = reply_for("damage_after_delivery_only", session.language)
                 session.add_turn("assistant", reply)
                 return reply
             session.awaiting_images = True
-            if not (session.pending_image_paths or []):
+            if not pending_imgs:
                 session.awaiting_images = True
-                reply = "تمام. أرفق صور المشكلة من خيار (Attach Images) ثم اكتب (تم/تأكيد) لإرسال الشكوى."
-                if session.language == "en":
-                    reply = "Okay. Attach images using (Attach Images), then type (confirm/yes) to submit."
+                reply = reply_for("attach_images_prompt", session.language)
                 session.add_turn("assistant", reply)
                 return reply
 
             # If delivered + images already attached -> submit immediately
             rec = create_complaint_record(
-                order_id=session.order_data.get("order_id", "") if session.order_data else (session.order_id or ""),
-                customer_name=session.order_data.get("customer_name", "") if session.order_data else "",
-                phone=session.order_data.get("phone", "") if session.order_data else "",
-                message=session.last_issue_text or user_text,
-                image_paths=session.pending_image_paths,
+                order_id=complaint_order_id,
+                customer_name=complaint_name,
+                phone=complaint_phone,
+                message=last_issue or user_text,
+                image_paths=pending_imgs,
                 category="damage",
             )
             session.pending_image_paths = []
             session.last_issue_text = None
-            if session.language == "ar":
-                reply = (
-                    "نعتذر عن الإزعاج اللي واجهته 🙏\n"
-                    "✅ تم تسجيل شكواك بنجاح، وسيتم متابعتها من قبل فريق الدعم.\n\n"
-                    f"رقم الشكوى:\n{rec['complaint_id']}\n\n"
-                    "هل في شيء ثاني أقدر أساعدك فيه؟"
-                )
-            else:        
-                reply = (
-                    "We’re sorry for the inconvenience you experienced 🙏\n"
-                    "Your complaint has been successfully recorded and will be reviewed by our support team.✅\n\n"
-                    f"Complaint ID:\n{rec['complaint_id']}"
-                    )
+            reply = reply_for("damage_recorded", session.language, default="en", complaint_id=rec["complaint_id"])
 
             session.add_turn("assistant", reply)
             return reply
 
         # ✅ If images are attached and user confirms -> submit last issue (for damage case)
-        if (session.pending_image_paths or []) and session.last_issue_text and is_yes(user_text):
+        if pending_imgs and last_issue and intents.yes:
             rec = create_complaint_record(
-                order_id=session.order_data.get("order_id", "") if session.order_data else (session.order_id or ""),
-                customer_name=session.order_data.get("customer_name", "") if session.order_data else "",
-                phone=session.order_data.get("phone", "") if session.order_data else "",
-                message=session.last_issue_text,
-                image_paths=session.pending_image_paths,
+                order_id=complaint_order_id,
+                customer_name=complaint_name,
+                phone=complaint_phone,
+                message=last_issue,
+                image_paths=pending_imgs,
                 category="damage",
             )
             session.pending_image_paths = []
             session.last_issue_text = None
             session.awaiting_images = False
 
-            if session.language == "ar":
-                reply = (
-                    "نعتذر عن الإزعاج اللي واجهته 🙏\n"
-                    "✅ تم تسجيل شكواك بنجاح، وسيتم متابعتها من قبل فريق الدعم.\n\n"
-                    f"رقم الشكوى:\n{rec['complaint_id']}\n\n"
-                    "هل في شيء ثاني أقدر أساعدك فيه؟"
-                )
-            else:        
-                reply = (
-                    "We’re sorry for the inconvenience you experienced 🙏\n"
-                    "Your complaint has been successfully recorded and will be reviewed by our support team.✅\n\n"
-                    f"Complaint ID:\n{rec['complaint_id']}"
-                    )
+            reply = reply_for("damage_recorded", session.language, default="en", complaint_id=rec["complaint_id"])
 
             session.add_turn("assistant", reply)
             return reply
         
         # reset complaint confirmation if user changed intent
-        if session.awaiting_complaint_confirmation and not is_yes(user_text) and not is_general_complaint(user_text):
+        if session.awaiting_complaint_confirmation and not intents.yes and not intents.general_complaint:
             session.awaiting_complaint_confirmation = False
 
         # 2) Escalation/Manager -> record without images (verified only)
-        if is_escalation_request(user_text) or (is_yes(user_text) and last_assistant_asked_escalation(session)):
+        if intents.escalation or (intents.yes and last_assistant_asked_escalation(session)):
             rec = create_complaint_record(
-                order_id=session.order_data.get("order_id", "") if session.order_data else (session.order_id or ""),
-                customer_name=session.order_data.get("customer_name", "") if session.order_data else "",
-                phone=session.order_data.get("phone", "") if session.order_data else "",
+                order_id=complaint_order_id,
+                customer_name=complaint_name,
+                phone=complaint_phone,
                 message=session.last_issue_text or user_text,
                 image_paths=[],
                 category="escalation",
@@ -712,9 +680,7 @@ def handle_customer_message(user_text: str, session: CustomerSession, llm) -> st
             session.pending_image_paths = []
             session.last_issue_text = None
 
-            reply = f"✅ تم تسجيل طلبك.\nرقم الشكوى: {rec['complaint_id']}"
-            if session.language == "en":
-                reply = f"✅ Your request has been recorded.\nComplaint ID: {rec['complaint_id']}"
+            reply = reply_for("escalation_recorded", session.language, complaint_id=rec["complaint_id"])
             session.add_turn("assistant", reply)
             return reply
         
@@ -727,33 +693,21 @@ def handle_customer_message(user_text: str, session: CustomerSession, llm) -> st
             "مسؤول" in t or "مدير" in t or "الإدارة" in t
         ):
             # لو كانت شكوى تأخير/خدمة -> تعامل معها محليًا (بدون LLM)
-            if is_general_complaint(user_text):
+            if intents.general_complaint:
                 if not session.awaiting_complaint_confirmation:
                     session.last_issue_text = user_text
                     session.awaiting_complaint_confirmation = True
 
-                    reply_ar = (
-                        empathy_prefix("ar") +
-                        "وصلتني تفاصيل المشكلة 👍\n"
-                        "هل تحب أسجل شكوى رسمية بخصوص التأخير؟\n"
-                        "اكتب (نعم) للتأكيد."
-                    )
-                    reply_en = (
-                        empathy_prefix("en") +
-                        "Thanks for explaining 👍\n"
-                        "Would you like me to submit an official complaint about the delay?\n"
-                        "Type (yes) to confirm."
-                    )
-                    reply = reply_en if session.language == "en" else reply_ar
+                    reply = reply_for("general_complaint_confirm_short", session.language)
                     session.add_turn("assistant", reply)
                     return reply
 
                 # لو منتظر تأكيد وجاء Yes
-                if session.awaiting_complaint_confirmation and is_yes(user_text):
+                if session.awaiting_complaint_confirmation and intents.yes:
                     rec = create_complaint_record(
-                        order_id=session.order_data.get("order_id", "") if session.order_data else (session.order_id or ""),
-                        customer_name=session.order_data.get("customer_name", "") if session.order_data else "",
-                        phone=session.order_data.get("phone", "") if session.order_data else "",
+                        order_id=complaint_order_id,
+                        customer_name=complaint_name,
+                        phone=complaint_phone,
                         message=session.last_issue_text or user_text,
                         image_paths=[],
                         category="service",
@@ -761,18 +715,16 @@ def handle_customer_message(user_text: str, session: CustomerSession, llm) -> st
                     session.awaiting_complaint_confirmation = False
                     session.last_issue_text = None
 
-                    reply_ar = f"✅ تم تسجيل الشكوى.\nرقم الشكوى: {rec['complaint_id']}"
-                    reply_en = f"✅ Your complaint has been recorded.\nComplaint ID: {rec['complaint_id']}"
-                    reply = reply_en if session.language == "en" else reply_ar
+                    reply = reply_for("complaint_recorded", session.language, complaint_id=rec["complaint_id"])
                     session.add_turn("assistant", reply)
                     return reply
 
              # لو طلب مسؤول/تصعيد (بدون ما نسجل قبل ما نوصل create_complaint_record)
-            if is_escalation_request(user_text) or (is_yes(user_text) and last_assistant_asked_escalation(session)):
+            if intents.escalation or (intents.yes and last_assistant_asked_escalation(session)):
                 rec = create_complaint_record(
-                    order_id=session.order_data.get("order_id", "") if session.order_data else (session.order_id or ""),
-                    customer_name=session.order_data.get("customer_name", "") if session.order_data else "",
-                    phone=session.order_data.get("phone", "") if session.order_data else "",
+                    order_id=complaint_order_id,
+                    customer_name=complaint_name,
+                    phone=complaint_phone,
                     message=session.last_issue_text or user_text,
                     image_paths=[],
                     category="escalation",
@@ -780,16 +732,14 @@ def handle_customer_message(user_text: str, session: CustomerSession, llm) -> st
                 session.pending_image_paths = []
                 session.last_issue_text = None
 
-                reply_ar = f"✅ تم تسجيل طلبك.\nرقم الشكوى: {rec['complaint_id']}"
-                reply_en = f"✅ Your request has been recorded.\nComplaint ID: {rec['complaint_id']}"
-                reply = reply_en if session.language == "en" else reply_ar
+                reply = reply_for("escalation_recorded", session.language, complaint_id=rec["complaint_id"])
                 session.add_turn("assistant", reply)
                 return reply
 
         # 3) Otherwise -> normal LLM
         reply = generate_llm_reply(
             llm, State.VERIFIED,
-            {"verified": True, "order": session.order_data, "knowledge": rag_context, "language": session.language},
+            {"verified": True, "order": session.order_data, "knowledge": _rag_result(rag_future), "language": session.language},
             user_text,
             session.recent_history(10),
         )
@@ -801,17 +751,10 @@ def handle_customer_message(user_text: str, session: CustomerSession, llm) -> st
 # Prompt Delegation
 # ============================================================
 
-def generate_llm_reply(llm, system_state: State, context: Dict, user_text: str, history: List[Dict[str, str]]) -> str:
-    knowledge = context.get("knowledge", "") or ""
-    context_no_knowledge = dict(context)
-    context_no_knowledge.pop("knowledge", None)
-
-    system_prompt = f"""
-=====================
-KNOWLEDGE (Policies / FAQs)
-=====================
-{knowledge}
-
+# Static rules block, built once at import: the only per-call parts of the
+# system prompt are the knowledge head and the state/context tail, so the
+# bulk of the prompt is not re-rendered through an f-string on every reply.
+_SYSTEM_PROMPT_RULES = """
 You are an AI Customer Support Assistant for an e-commerce platform.
 
 =====================
@@ -934,14 +877,107 @@ IMPORTANT:
   - You MUST acknowledge successful verification.
   - You MUST ask the customer how you can help next.
   - You MUST NOT claim that any complaint or request was recorded unless explicitly stated in CONTEXT.
+""".strip()
 
-=====================
-CURRENT SYSTEM STATE:
-{system_state}
 
-CONTEXT:
-{json.dumps(context_no_knowledge, ensure_ascii=False)}
-""".strip()
+# Deterministic verification turns ("ask for the order id", "ask for the
+# phone", "no order on that number") used to burn a full gpt-4.1 round trip
+# to emit what is effectively a fixed sentence. Those (state, situation,
+# language) combinations are answered straight from this table; the model is
+# only consulted for IDLE policy questions and VERIFIED conversation.
+TEMPLATE_REPLIES: Dict[tuple, str] = {
+    (State.AWAITING_ORDER_ID.value, "ask_order_id", "ar"):
+        "تمام 👍 حتى أقدر أساعدك بالطلب، ممكن تزودني برقم الطلب؟ (مثال: ORD-1001)",
+    (State.AWAITING_ORDER_ID.value, "ask_order_id", "en"):
+        "Sure 👍 To help with your order, could you share your order ID? (e.g. ORD-1001)",
+    (State.AWAITING_PHONE.value, "ask_phone", "ar"):
+        "ولا يهمك 👍 ممكن تزودني برقم الهاتف المسجل على الطلب؟",
+    (State.AWAITING_PHONE.value, "ask_phone", "en"):
+        "No problem 👍 Could you share the phone number registered on the order?",
+    (State.AWAITING_PHONE.value, "order_exists", "ar"):
+        "تمام، لإكمال التحقق ممكن تزودني برقم الهاتف المسجل على هذا الطلب؟",
+    (State.AWAITING_PHONE.value, "order_exists", "en"):
+        "Great — to complete verification, could you share the phone number registered on this order?",
+    (State.AWAITING_ORDER_ID.value, "no_order_for_phone", "ar"):
+        "عذراً، ما لقيت أي طلب مسجل على هذا الرقم. ممكن تتأكد من الرقم، أو تزودني برقم الطلب مباشرة؟",
+    (State.AWAITING_ORDER_ID.value, "no_order_for_phone", "en"):
+        "Sorry, I couldn't find any order registered under that number. Could you double-check it, or share your order ID directly?",
+    (State.AWAITING_PHONE.value, "phone_no_match", "ar"):
+        "عذراً، هذا الرقم غير مطابق لبيانات الطلب، فما أقدر أشارك أي تفاصيل عن الطلب.",
+    (State.AWAITING_PHONE.value, "phone_no_match", "en"):
+        "Sorry, that phone number doesn't match the order details, so I can't share any order information.",
+}
+
+
+def _template_context_key(state_value: str, context: Dict) -> Optional[str]:
+    if context.get("verified"):
+        return None
+    if context.get("reason") == "no_order_for_phone":
+        return "no_order_for_phone"
+    if context.get("phone_match") is False:
+        return "phone_no_match"
+    if context.get("order_exists"):
+        return "order_exists"
+    if state_value == State.AWAITING_ORDER_ID.value:
+        return "ask_order_id"
+    if state_value == State.AWAITING_PHONE.value:
+        return "ask_phone"
+    return None
+
+
+# Model routing: VERIFIED replies can be dropped to a cheaper tier (e.g.
+# LLM_MODEL_VERIFIED=gpt-4.1-mini) without touching code; everything else
+# keeps the wrapper's default. Verification states that still reach the
+# model (template miss) run at temperature 0 so identical turns produce
+# identical replies, which also keeps the _REPLY_CACHE hit rate high.
+_MODEL_VERIFIED = os.getenv("LLM_MODEL_VERIFIED")
+_DETERMINISTIC_STATES = frozenset({State.AWAITING_ORDER_ID.value, State.AWAITING_PHONE.value})
+
+
+# Exact-duplicate turns (same state, same context, same visible history)
+# produce the same prompt, so the previous completion can be replayed without
+# another API round trip. Keyed on the full message list, staleness-free:
+# order data is embedded in the system prompt and thus part of the key.
+_REPLY_CACHE: "OrderedDict[tuple, str]" = OrderedDict()
+
+
+def _template_reply(state_value: str, context: Dict) -> Optional[str]:
+    """Canned sentence for a deterministic transition, or None (use the LLM)."""
+    template_key = _template_context_key(state_value, context)
+    if template_key is None:
+        return None
+    return TEMPLATE_REPLIES.get((state_value, template_key, context.get("language") or "ar"))
+
+
+def _ctx_default(o):
+    # State (or anything else non-JSON-native) renders by value in the prompt
+    return o.value if isinstance(o, State) else str(o)
+
+
+def _dump_context(context_no_knowledge: Dict) -> str:
+    if orjson is not None:
+        return orjson.dumps(context_no_knowledge, default=_ctx_default).decode("utf-8")
+    return json.dumps(context_no_knowledge, ensure_ascii=False, default=_ctx_default)
+
+
+def _build_llm_messages(system_state: State, context: Dict, user_text: str, history: List[Dict[str, str]]):
+    """Assemble the message list and its reply-cache key for one LLM turn."""
+    knowledge = context.get("knowledge", "") or ""
+    context_no_knowledge = dict(context)
+    context_no_knowledge.pop("knowledge", None)
+    if isinstance(context_no_knowledge.get("order"), OrderSnapshot):
+        context_no_knowledge["order"] = asdict(context_no_knowledge["order"])
+
+    system_prompt = (
+        "=====================\n"
+        "KNOWLEDGE (Policies / FAQs)\n"
+        "=====================\n"
+        f"{knowledge}\n\n"
+        f"{_SYSTEM_PROMPT_RULES}\n\n"
+        "=====================\n"
+        f"CURRENT SYSTEM STATE:\n{system_state}\n\n"
+        f"CONTEXT:\n{_dump_context(context_no_knowledge)}"
+    )
 
     messages = [{"role": "system", "content": system_prompt}]
 
@@ -954,4 +990,61 @@ CONTEXT:
     if not messages or messages[-1]["role"] != "user":
         messages.append({"role": "user", "content": user_text})
 
-    return llm.invoke(messages).content.strip()
+    cache_key = (
+        getattr(system_state, "value", system_state),
+        context.get("language"),
+        tuple((m["role"], m["content"]) for m in messages),
+    )
+    return messages, cache_key
+
+
+def generate_llm_reply(llm, system_state: State, context: Dict, user_text: str, history: List[Dict[str, str]]) -> str:
+    state_value = getattr(system_state, "value", system_state)
+
+    # deterministic transition -> canned sentence, no API round trip
+    template = _template_reply(state_value, context)
+    if template is not None:
+        return template
+
+    messages, cache_key = _build_llm_messages(system_state, context, user_text, history)
+    cached = _REPLY_CACHE.get(cache_key)
+    if cached is not None:
+        _REPLY_CACHE.move_to_end(cache_key)
+        return cached
+
+    model = _MODEL_VERIFIED if state_value == State.VERIFIED.value else None
+    temperature = 0.0 if state_value in _DETERMINISTIC_STATES else None
+    reply = llm.invoke(messages, model=model, temperature=temperature).content.strip()
+    _cache_put(_REPLY_CACHE, cache_key, reply)
+    return reply
+
+
+def generate_llm_reply_stream(llm, system_state: State, context: Dict, user_text: str, history: List[Dict[str, str]]):
+    """
+    Streaming variant of generate_llm_reply: yields text deltas as they
+    arrive so a UI can paint partial output instead of blocking on the
+    full completion. Template hits and cached replies are yielded whole.
+    Complaint/escalation branches stay on the non-streaming path in the
+    FSM — they must commit the record before anything is shown.
+    """
+    state_value = getattr(system_state, "value", system_state)
+
+    template = _template_reply(state_value, context)
+    if template is not None:
+        yield template
+        return
+
+    messages, cache_key = _build_llm_messages(system_state, context, user_text, history)
+    cached = _REPLY_CACHE.get(cache_key)
+    if cached is not None:
+        _REPLY_CACHE.move_to_end(cache_key)
+        yield cached
+        return
+
+    model = _MODEL_VERIFIED if state_value == State.VERIFIED.value else None
+    temperature = 0.0 if state_value in _DETERMINISTIC_STATES else None
+    parts: List[str] = []
+    for delta in llm.stream(messages, model=model, temperature=temperature):
+        parts.append(delta)
+        yield delta
+    _cache_put(_REPLY_CACHE, cache_key, "".join(parts).strip())
@@ -0,0 +1,166 @@
+"""
+Single-pass intent classification for one user message.
+
+Each keyword list collapses into one compiled alternation, and
+classify_text() runs every pattern exactly once over the lowered text.
+The FSM reads the resulting flags instead of re-scanning the message in
+every branch; the is_* predicates stay available for one-off callers.
+"""
+
+import re
+from dataclasses import dataclass
+
+_NON_DIGIT_RE = re.compile(r"\D")
+
+
+def _keywords_re(*word_lists) -> "re.Pattern":
+    words = [w for ws in word_lists for w in ws]
+    return re.compile("|".join(map(re.escape, words)))
+
+
+_DONT_KNOW_ORDER_RE = _keywords_re(
+    ["ما بعرف", "مش عارف", "ما عندي رقم", "نسيت رقم", "مش متذكر", "ما بتذكر", "ما معي رقم"],
+    ["don't know", "do not know", "no order id", "forgot", "i don't remember"],
+)
+
+_POLICY_RE = _keywords_re(
+    ["سياسة", "سياسات", "استرجاع", "ارجاع", "إرجاع", "استبدال", "ضمان", "خصوصية", "شروط", "توصيل", "استرداد"],
+    ["policy", "refund", "return", "exchange", "warranty", "privacy", "terms", "delivery"],
+)
+
+_POLICY_TOO_GENERIC_RE = _keywords_re([
+    "all policies", "your policies", "policies list", "what are the policies",
+    "كل السياسات", "اعطيني السياسات", "سياساتك", "شو السياسات"
+])
+
+_ORDER_RE = _keywords_re(
+    ["طلبي", "طلبيتي", "طلب", "رقم الطلب", "تتبع", "وين طلبي", "تاخر", "تأخر", "توصيل", "شحنة", "مندوب", "سائق"],
+    ["order", "track", "tracking", "delivery", "delayed", "shipment", "courier", "driver"],
+)
+
+_ESCALATION_RE = _keywords_re(
+    [
+        "مدير", "مسؤول", "المسؤول", "الإدارة", "تصعيد",
+        "اشكي", "شكوى", "ارفع شكوى", "ارفعها", "شكيت",
+        "بدي حد مسؤول", "بدي المسؤول", "حولني لمسؤول"
+    ],
+    [
+        "manager", "supervisor", "escalate",
+        "complaint", "raise a complaint",
+        "responsible", "person in charge", "someone in charge",
+        "boss", "team lead", "support lead"
+    ],
+)
+
+_YES_WORDS = frozenset(
+    ["نعم", "اه", "آه", "ايوه", "اي", "yes", "yep", "yeah", "ok", "تمام", "تم", "تأكيد", "أكد", "confirm"]
+)
+
+_SYSTEM_PROBE_RE = _keywords_re(
+    [
+        "برومبت", "البرومبت", "تعليماتك", "قواعدك", "كيف بتشتغل", "كيف تعمل",
+        "السيستم", "منطقك", "آلية عملك",
+        "ايش السياسات", "إيش السياسات", "شو السياسات", "السياسات اللي عندك",
+        "اعطيني السياسات", "هات السياسات", "سياساتك", "سياسة النظام", "سياسات النظام"
+    ],
+    [
+        "prompt", "system prompt", "your prompt", "instructions", "your rules",
+        "internal rules", "how do you work", "tell me your policies", "all policies", "tell me all policies"
+    ],
+)
+
+_POST_DELIVERY_RE = _keywords_re(
+    ["تلف", "مكسور", "خربان", "ناقص", "تالف", "فتح", "مفتوح", "وصلني غلط", "منتج غلط", "غلط بالطلب", "مشكلة بالمنتج"],
+    ["damage", "damaged", "broken", "missing", "defect", "opened", "wrong item", "wrong product"],
+)
+
+_GENERAL_COMPLAINT_RE = _keywords_re(
+    [
+        "تأخير", "تاخير", "تاخر", "تأخر", "متأخر",
+        "سوء", "تعامل", "مندوب", "سائق", "درايفر",
+        "مش محترم", "وقح", "اسلوب", "خدمة سيئة", "توصيل سيء"
+    ],
+    ["delay", "late", "bad service", "rude", "courier", "driver", "behavior", "attitude"],
+)
+
+
+def extract_digits(text: str) -> str:
+    return _NON_DIGIT_RE.sub("", (text or ""))
+
+def looks_like_phone(text: str) -> bool:
+    d = extract_digits(text)
+    return 9 <= len(d) <= 15
+
+def looks_like_order_id(text: str) -> bool:
+    t = (text or "").strip().upper()
+    return t.startswith("ORD-") and len(t) >= 6
+
+def user_says_dont_know_order(text: str) -> bool:
+    t = (text or "").strip().lower()
+    return bool(_DONT_KNOW_ORDER_RE.search(t))
+
+def is_policy_intent(text: str) -> bool:
+    t = (text or "").strip().lower()
+    # ✅ must be a specific policy question (avoid "tell me all policies")
+    return bool(_POLICY_RE.search(t)) and not _POLICY_TOO_GENERIC_RE.search(t)
+
+
+def is_order_intent(text: str) -> bool:
+    t = (text or "").strip().lower()
+    return (
+        bool(_ORDER_RE.search(t))
+        or looks_like_order_id(text)
+        or looks_like_phone(text)
+    )
+
+def is_escalation_request(text: str) -> bool:
+    t = (text or "").strip().lower()
+    return bool(_ESCALATION_RE.search(t))
+
+def is_yes(text: str) -> bool:
+    return (text or "").strip().lower() in _YES_WORDS
+
+def is_system_probe(text: str) -> bool:
+    t = (text or "").strip().lower()
+    return bool(_SYSTEM_PROBE_RE.search(t))
+
+def is_post_delivery_complaint(text: str) -> bool:
+    t = (text or "").lower()
+    return bool(_POST_DELIVERY_RE.search(t))
+
+def is_general_complaint(text: str) -> bool:
+    t = (text or "").lower()
+    return bool(_GENERAL_COMPLAINT_RE.search(t))
+
+
+@dataclass(frozen=True, slots=True)
+class Intents:
+    """All message-level flags the FSM branches on, computed in one pass."""
+    order_id_like: bool = False
+    phone_like: bool = False
+    dont_know_order: bool = False
+    policy: bool = False
+    order: bool = False
+    escalation: bool = False
+    yes: bool = False
+    system_probe: bool = False
+    post_delivery_complaint: bool = False
+    general_complaint: bool = False
+
+
+def classify_text(text: str) -> Intents:
+    t = (text or "").strip().lower()
+    order_id_like = looks_like_order_id(text)
+    phone_like = looks_like_phone(text)
+    return Intents(
+        order_id_like=order_id_like,
+        phone_like=phone_like,
+        dont_know_order=bool(_DONT_KNOW_ORDER_RE.search(t)),
+        policy=bool(_POLICY_RE.search(t)) and not _POLICY_TOO_GENERIC_RE.search(t),
+        order=bool(_ORDER_RE.search(t)) or order_id_like or phone_like,
+        escalation=bool(_ESCALATION_RE.search(t)),
+        yes=t in _YES_WORDS,
+        system_probe=bool(_SYSTEM_PROBE_RE.search(t)),
+        post_delivery_complaint=bool(_POST_DELIVERY_RE.search(t)),
+        general_complaint=bool(_GENERAL_COMPLAINT_RE.search(t)),
+    )
@@ -1,4 +1,9 @@
 import os
+import pickle
+from functools import lru_cache
+from pathlib import Path
+
+import faiss
 from openai import OpenAI
 from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import FAISS
@@ -7,20 +12,50 @@ class GPTWrapper:
     def __init__(self, api_key: str):
         self.client = OpenAI(api_key=api_key)
 
-    def invoke(self, messages):
+    def invoke(self, messages, model=None, temperature=None):
         resp = self.client.chat.completions.create(
-            model="gpt-4.1",
+            model=model or "gpt-4.1",
             messages=messages,
-            temperature=0.3
+            temperature=0.3 if temperature is None else temperature
         )
         return resp.choices[0].message
 
+    def stream(self, messages, model=None, temperature=None):
+        chunks = self.client.chat.completions.create(
+            model=model or "gpt-4.1",
+            messages=messages,
+            temperature=0.3 if temperature is None else temperature,
+            stream=True
+        )
+        for chunk in chunks:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                yield delta
+
 def make_llm():
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         return None
     return GPTWrapper(api_key)
 
+@lru_cache(maxsize=1)
 def load_rag(index_dir: str = "rag_index"):
     embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-    return FAISS.load_local(index_dir, embeddings, allow_dangerous_deserialization=True)
+    try:
+        # Memory-map the vectors: startup stops copying the whole index onto
+        # the heap and pages are faulted in on first search instead.
+        index = faiss.read_index(
+            str(Path(index_dir) / "index.faiss"),
+            faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY,
+        )
+        with open(Path(index_dir) / "index.pkl", "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        return FAISS(
+            embedding_function=embeddings,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=index_to_docstore_id,
+        )
+    except Exception:
+        # fall back to LangChain's own loader (e.g. unexpected pkl layout)
+        return FAISS.load_local(index_dir, embeddings, allow_dangerous_deserialization=True)
@@ -1,8 +1,16 @@
 import json
-from datetime import datetime
+import os
+import threading
+import time
+from contextlib import contextmanager
 from typing import Any, Dict, List
 import re
 
+try:
+    import orjson  # 3-10x faster (de)serialization, UTF-8 native
+except ImportError:
+    orjson = None
+
 from config import ORDERS_FILE, ORDER_STATUSES, STATUS_LABELS
 
 # ===============================
@@ -11,63 +19,261 @@ from config import ORDERS_FILE, ORDER_STATUSES, STATUS_LABELS
 
 PAYMENT_METHODS = ["cash", "card", "online", "wallet"]
 
+# Orders are stored append-only as JSONL (one record per line, last line
+# per order_id wins), so a mutation is a single appended line instead of a
+# full-file rewrite. The file is compacted (rewritten with only the live
+# records) once superseded lines exceed _COMPACT_RATIO of the file.
+_LEGACY_ORDERS_JSON = ORDERS_FILE.with_suffix(".json")
+_COMPACT_RATIO = 0.25
+
+# Parsed orders cache keyed by file mtime: every chat turn calls
+# _load_orders(), so re-parsing the file is skipped until it actually
+# changes on disk. "by_phone" is a normalized-phone -> [order_id]
+# reverse index kept alongside the cache so phone lookups are O(1)
+# instead of a scan over every order. "lines" counts physical JSONL
+# lines (for the compaction trigger).
+_ORDERS_CACHE: Dict[str, Any] = {"mtime": None, "data": {}, "by_phone": {}, "lines": 0}
+_ORDERS_LOCK = threading.RLock()
+_BATCH_DEPTH = 0
+_BATCH_DIRTY = False
+
+
+def _loads(payload):
+    if orjson is not None:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+
+def _dump_line(order_id: str, order: dict) -> bytes:
+    rec = {"order_id": order_id, **order}
+    if orjson is not None:
+        return orjson.dumps(rec, option=orjson.OPT_NON_STR_KEYS) + b"\n"
+    return (json.dumps(rec, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def _build_phone_index(data: dict) -> Dict[str, List[str]]:
+    index: Dict[str, List[str]] = {}
+    for order_id, order in data.items():
+        phone = normalize_phone(order.get("phone", ""))
+        index.setdefault(phone, []).append(order_id)
+    return index
+
+
+def _index_add(phone: str, order_id: str) -> None:
+    # callers hold _ORDERS_LOCK; phone is already normalized
+    _ORDERS_CACHE["by_phone"].setdefault(phone, []).append(order_id)
+
+
+def _index_discard(phone: str, order_id: str) -> None:
+    # callers hold _ORDERS_LOCK; phone is already normalized
+    bucket = _ORDERS_CACHE["by_phone"].get(phone)
+    if bucket and order_id in bucket:
+        bucket.remove(order_id)
+        if not bucket:
+            del _ORDERS_CACHE["by_phone"][phone]
+
 
 def _now_iso() -> str:
-    return datetime.now().isoformat(timespec="seconds")
+    # same second-resolution ISO shape as before, without building
+    # a datetime object on every mutation
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime())
 
 
 def _ensure_orders_parent():
     ORDERS_FILE.parent.mkdir(parents=True, exist_ok=True)
 
 
+def _migrate_legacy_json() -> dict:
+    """One-time migration from the old orders.json whole-file format."""
+    try:
+        data = _loads(_LEGACY_ORDERS_JSON.read_bytes())
+    except (OSError, ValueError) as e:
+        print("DEBUG: legacy orders.json unreadable:", e)
+        return {}
+    if not isinstance(data, dict):
+        data = {}
+
+    with _ORDERS_LOCK:
+        _ORDERS_CACHE["data"] = data
+        _ORDERS_CACHE["by_phone"] = _build_phone_index(data)
+    _flush_all(data)
+    return data
+
+
 def _load_orders() -> dict:
     """
-    Safe load:
-    - If file doesn't exist -> {}
-    - If JSON is corrupted/empty -> {}
+    Safe load (cached by mtime):
+    - If file doesn't exist or is empty -> {} (after legacy migration)
+    - Corrupt lines are skipped (and the error is printed, not swallowed)
     """
-    if not ORDERS_FILE.exists():
+    with _ORDERS_LOCK:
+        if _BATCH_DIRTY:
+            # unflushed mutations from buffered_orders() are the latest state
+            return _ORDERS_CACHE["data"]
+
+    try:
+        st = os.stat(ORDERS_FILE)  # one syscall: existence + size + mtime
+    except OSError:
+        if _LEGACY_ORDERS_JSON.exists():
+            return _migrate_legacy_json()
         return {}
 
+    if st.st_size == 0:
+        # freshly created/truncated file; nothing to parse
+        return {}
+
+    with _ORDERS_LOCK:
+        if _ORDERS_CACHE["mtime"] == st.st_mtime_ns:
+            return _ORDERS_CACHE["data"]
+
     try:
-        with open(ORDERS_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            return data if isinstance(data, dict) else {}
-    except Exception:
-        # corrupted json, empty file, etc.
+        raw = ORDERS_FILE.read_bytes()
+    except OSError as e:
+        print("DEBUG: orders file unreadable:", e)
         return {}
 
+    data: Dict[str, Any] = {}
+    lines = 0
+    for line in raw.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            rec = _loads(line)
+        except ValueError as e:  # covers json.JSONDecodeError and orjson.JSONDecodeError
+            print("DEBUG: skipping corrupt orders line:", e)
+            continue
+        if not isinstance(rec, dict) or not rec.get("order_id"):
+            continue
+        lines += 1
+        # last line per order_id wins; dict keeps first-seen order
+        data[rec.pop("order_id")] = rec
+
+    with _ORDERS_LOCK:
+        _ORDERS_CACHE["mtime"] = st.st_mtime_ns
+        _ORDERS_CACHE["data"] = data
+        _ORDERS_CACHE["by_phone"] = _build_phone_index(data)
+        _ORDERS_CACHE["lines"] = lines
+    return data
+
+
+def _flush_all(data: dict):
+    """Compaction: rewrite the JSONL file with only the live records."""
+    _ensure_orders_parent()
+
+    # Write to a sibling tmp file and swap it in atomically, so a crash
+    # mid-write can never leave the file truncated or half-serialized.
+    tmp = ORDERS_FILE.with_suffix(ORDERS_FILE.suffix + ".tmp")
+    with open(tmp, "wb") as f:
+        for order_id, order in data.items():
+            f.write(_dump_line(order_id, order))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, ORDERS_FILE)
+
+    with _ORDERS_LOCK:
+        _ORDERS_CACHE["mtime"] = os.stat(ORDERS_FILE).st_mtime_ns
+        _ORDERS_CACHE["lines"] = len(data)
 
-def _save_orders(data: dict):
+
+def _append_order(order_id: str, order: dict):
+    """Append-only write path: one fsynced line per mutation."""
     _ensure_orders_parent()
-    with open(ORDERS_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    with open(ORDERS_FILE, "ab") as f:
+        f.write(_dump_line(order_id, order))
+        f.flush()
+        os.fsync(f.fileno())
+    with _ORDERS_LOCK:
+        _ORDERS_CACHE["mtime"] = os.stat(ORDERS_FILE).st_mtime_ns
+        _ORDERS_CACHE["lines"] += 1
+
+
+def _maybe_compact():
+    with _ORDERS_LOCK:
+        lines = _ORDERS_CACHE["lines"]
+        data = _ORDERS_CACHE["data"]
+        superseded = lines - len(data)
+    if lines and superseded > lines * _COMPACT_RATIO:
+        _flush_all(data)
+
+
+def _record_mutation(order_id: str, data: dict):
+    """Single-record write: append a line, or defer inside buffered_orders()."""
+    global _BATCH_DIRTY
+    with _ORDERS_LOCK:
+        if _ORDERS_CACHE["data"] is not data:
+            # the phone index was built against another dict; adopt + rebuild
+            _ORDERS_CACHE["data"] = data
+            _ORDERS_CACHE["by_phone"] = _build_phone_index(data)
+        if _BATCH_DEPTH > 0:
+            # inside buffered_orders(): flush once on exit
+            _BATCH_DIRTY = True
+            return
+    _append_order(order_id, data[order_id])
+    _maybe_compact()
+
+
+@contextmanager
+def buffered_orders():
+    """
+    Defer disk writes for bulk mutations:
+        with buffered_orders():
+            create_order(...)  # many times
+    The orders file is rewritten once on exit instead of appending per mutation.
+    """
+    global _BATCH_DEPTH, _BATCH_DIRTY
+    with _ORDERS_LOCK:
+        _BATCH_DEPTH += 1
+    try:
+        yield
+    finally:
+        with _ORDERS_LOCK:
+            _BATCH_DEPTH -= 1
+            flush_needed = (_BATCH_DEPTH == 0 and _BATCH_DIRTY)
+            if flush_needed:
+                _BATCH_DIRTY = False
+                data = _ORDERS_CACHE["data"]
+        if flush_needed:
+            _flush_all(data)
+
+
+# Inverted once at import: every canonical key and lowercased display label
+# maps straight to its key, so normalize_status is a single dict lookup.
+_LABEL_TO_KEY = {key: key for key in STATUS_LABELS}
+for _key, _labels in STATUS_LABELS.items():
+    _LABEL_TO_KEY.update({_v.lower(): _key for _v in _labels.values()})
 
 
 def normalize_status(input_status: str) -> str:
     if not input_status:
         raise ValueError("Status is required")
 
-    s = input_status.strip().lower()
-
-    for key, labels in STATUS_LABELS.items():
-        if s == key:
-            return key
-        if s in [v.lower() for v in labels.values()]:
-            return key
-
-    raise ValueError("Unknown order status")
+    key = _LABEL_TO_KEY.get(input_status.strip().lower())
+    if key is None:
+        raise ValueError("Unknown order status")
+    return key
 
 
 def format_status(status_key: str, lang: str = "en") -> str:
     return STATUS_LABELS.get(status_key, {}).get(lang, status_key)
 
 
+# Built once: Arabic-Indic (U+0660-U+0669) and Extended Arabic-Indic
+# (U+06F0-U+06F9) digits fold onto ASCII, so phones typed on an Arabic
+# keyboard compare equal to the stored ASCII numbers.
+_ARABIC_DIGIT_TRANS = str.maketrans(
+    "٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹",
+    "01234567890123456789",
+)
+_NON_ASCII_DIGIT_RE = re.compile(r"[^0-9]")
+
+
 def normalize_phone(phone: str) -> str:
     if not phone:
         return ""
 
-    digits = re.sub(r"\D", "", str(phone))  # keep digits only
+    # fold Arabic digits, then keep digits only
+    digits = _NON_ASCII_DIGIT_RE.sub("", str(phone).translate(_ARABIC_DIGIT_TRANS))
 
     # Jordan country code 962 -> convert to local starting 0
     if digits.startswith("962"):
@@ -90,6 +296,16 @@ def _clean_str(x: Any) -> str:
     return str(x).strip() if x is not None else ""
 
 
+def _items_total(items: list) -> float:
+    # pure function of items, so it's computed once at save time and
+    # persisted instead of being re-derived on every dashboard render
+    total = 0.0
+    for it in items or []:
+        if isinstance(it, dict):
+            total += (it.get("quantity", 1) or 1) * (it.get("unit_price", 0) or 0)
+    return total
+
+
 # ===============================
 # CRUD operations
 # ===============================
@@ -102,15 +318,10 @@ def create_order(
     items: list,
     payment_method: str = "cash"
 ):
-    orders = _load_orders()
-
     order_id = _clean_str(order_id)
     if not order_id:
         raise ValueError("Order ID is required.")
 
-    if order_id in orders:
-        raise ValueError(f"Order {order_id} already exists.")
-
     customer_name = _clean_str(customer_name)
     phone = normalize_phone(_clean_str(phone))
     address = _clean_str(address)
@@ -119,35 +330,46 @@ def create_order(
     if items is None:
         items = []
 
-    orders[order_id] = {
-        "customer_name": customer_name,
-        "phone": phone,
-        "delivery_address": address,
-        "items": items,
-        "payment_method": payment_method,
-        "status": "received",
-        "created_at": _now_iso(),
-        "last_updated": _now_iso()
-    }
+    # hold the lock across the whole read-modify-write so two concurrent
+    # sessions can't interleave between the existence check and the save
+    with _ORDERS_LOCK:
+        orders = _load_orders()
 
-    _save_orders(orders)
+        if order_id in orders:
+            raise ValueError(f"Order {order_id} already exists.")
 
+        orders[order_id] = {
+            "customer_name": customer_name,
+            "phone": phone,
+            "delivery_address": address,
+            "items": items,
+            "total": _items_total(items),
+            "payment_method": payment_method,
+            "status": "received",
+            "created_at": _now_iso(),
+            "last_updated": _now_iso()
+        }
 
-def update_order_status(order_id: str, new_status: str):
-    orders = _load_orders()
+        _index_add(phone, order_id)
+        _record_mutation(order_id, orders)
 
-    order_id = _clean_str(order_id)
-    if order_id not in orders:
-        raise ValueError("Order not found.")
 
+def update_order_status(order_id: str, new_status: str):
+    order_id = _clean_str(order_id)
     status_key = normalize_status(new_status)
     if status_key not in ORDER_STATUSES:
         raise ValueError("Invalid status.")
 
-    orders[order_id]["status"] = status_key
-    orders[order_id]["last_updated"] = _now_iso()
+    with _ORDERS_LOCK:
+        orders = _load_orders()
 
-    _save_orders(orders)
+        if order_id not in orders:
+            raise ValueError("Order not found.")
+
+        orders[order_id]["status"] = status_key
+        orders[order_id]["last_updated"] = _now_iso()
+
+        _record_mutation(order_id, orders)  # status change never moves a phone bucket
 
 
 def update_order(order_id: str, patch: dict):
@@ -161,11 +383,7 @@ def update_order(order_id: str, patch: dict):
     - status
     - payment_method
     """
-    orders = _load_orders()
-
     order_id = _clean_str(order_id)
-    if order_id not in orders:
-        raise ValueError("Order not found.")
 
     allowed = {"customer_name", "phone", "delivery_address", "items", "status", "payment_method"}
     patch = patch or {}
@@ -190,12 +408,31 @@ def update_order(order_id: str, patch: dict):
             raise ValueError("Invalid status.")
 
     # items: keep as-is (list[str] or list[dict]) but ensure list type
-    if "items" in clean and clean["items"] is None:
-        clean["items"] = []
+    if "items" in clean:
+        if clean["items"] is None:
+            clean["items"] = []
+        clean["total"] = _items_total(clean["items"])
+
+    with _ORDERS_LOCK:
+        orders = _load_orders()
+
+        if order_id not in orders:
+            raise ValueError("Order not found.")
 
-    orders[order_id].update(clean)
-    orders[order_id]["last_updated"] = _now_iso()
-    _save_orders(orders)
+        current = orders[order_id]
+        if all(current.get(k) == v for k, v in clean.items()):
+            # no-op patch: skip the write and leave last_updated alone
+            return
+
+        old_phone = orders[order_id].get("phone", "")
+        orders[order_id].update(clean)
+        orders[order_id]["last_updated"] = _now_iso()
+
+        new_phone = orders[order_id].get("phone", "")
+        if new_phone != old_phone:
+            _index_discard(old_phone, order_id)
+            _index_add(new_phone, order_id)
+        _record_mutation(order_id, orders)
 
 
 def get_order(order_id: str, lang: str = "en") -> dict:
@@ -211,6 +448,15 @@ def get_order(order_id: str, lang: str = "en") -> dict:
     return order
 
 
+def list_orders_raw() -> dict:
+    """
+    The cached orders dict itself — no per-order copy, no status_label.
+    For read-only callers (KPI counts, lookups); treat it as immutable
+    and go through create_order/update_order for any change.
+    """
+    return _load_orders()
+
+
 def list_orders(lang: str = "en") -> dict:
     orders = _load_orders()
     output = {}
@@ -225,12 +471,7 @@ def list_orders(lang: str = "en") -> dict:
 
 def find_orders_by_phone(phone: str) -> list:
     phone = normalize_phone(phone)
-    orders = _load_orders()
-    matches = []
-
-    for order_id, order in orders.items():
-        stored_phone = normalize_phone(order.get("phone", ""))
-        if stored_phone == phone:
-            matches.append(order_id)
+    _load_orders()  # refresh cache + phone index if the file changed
 
-    return matches
+    with _ORDERS_LOCK:
+        return list(_ORDERS_CACHE["by_phone"].get(phone, []))
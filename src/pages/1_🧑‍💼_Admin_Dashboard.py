@@ -1,13 +1,23 @@
+import os
+from collections import Counter
+
 import streamlit as st
 import pandas as pd
 from pathlib import Path
 
+try:
+    # optional: paginated tables with built-in filter/sort/search
+    from st_aggrid import AgGrid, GridOptionsBuilder
+except ImportError:
+    AgGrid = None
+
 from auth import require_role, logout
 from ui import app_header, sidebar_shell
 from complaint_manager import list_complaints, get_complaint, update_complaint
-from config import ORDER_STATUSES
+from config import COMPLAINTS_FILE, ORDER_STATUSES, ORDERS_FILE
 from order_manager import (
     list_orders,
+    list_orders_raw,
     create_order,
     update_order_status,
     get_order,
@@ -33,14 +43,16 @@ if st.sidebar.button("Logout"):
 PREFERRED_STATUS_ORDER = ["received", "preparing", "out_for_delivery", "delivered", "cancelled"]
 STATUS_OPTIONS = [s for s in PREFERRED_STATUS_ORDER if s in ORDER_STATUSES] + \
                  sorted([s for s in ORDER_STATUSES if s not in PREFERRED_STATUS_ORDER])
+_STATUS_INDEX = {s: i for i, s in enumerate(STATUS_OPTIONS)}
 
 def status_index(current: str) -> int:
-    return STATUS_OPTIONS.index(current) if current in STATUS_OPTIONS else 0
+    return _STATUS_INDEX.get(current, 0)
 
 # =========================
 # Payment method options (FIX: define globally)
 # =========================
 PM_OPTIONS = ["cash", "card", "online", "wallet", "other"]
+_PM_INDEX = {p: i for i, p in enumerate(PM_OPTIONS)}
 
 # =========================
 # Helpers for items
@@ -69,18 +81,20 @@ def df_to_items(df):
     if df is None or df.empty:
         return items
 
-    for _, r in df.iterrows():
-        name = str(r.get("name", "")).strip()
+    # itertuples yields plain tuples — no per-cell Series boxing like iterrows
+    cols = df[["name", "quantity", "unit_price", "note"]]
+    for name, quantity, unit_price, note in cols.itertuples(index=False, name=None):
+        name = str(name).strip()
         if not name:
             continue
 
         try:
-            qty = int(r.get("quantity", 1))
+            qty = int(quantity)
         except Exception:
             qty = 1
 
         try:
-            price = float(r.get("unit_price", 0))
+            price = float(unit_price)
         except Exception:
             price = 0.0
 
@@ -88,7 +102,7 @@ def df_to_items(df):
             "name": name,
             "quantity": max(qty, 1),
             "unit_price": max(price, 0),
-            "note": str(r.get("note", "")).strip(),
+            "note": str(note).strip(),
         })
 
     return items
@@ -101,20 +115,300 @@ def calc_total(items):
     return total
 
 
+# =========================
+# Fragments
+# =========================
+# Interactions inside these blocks (selectbox changes, keystroke commits,
+# editor edits) rerun only the fragment, not the whole dashboard script.
+# Mutations rerun the full app so KPIs and tables pick up the change.
+
+@st.fragment
+def quick_status_update(oid: str, current_status: str):
+    st.markdown("**Quick Status Update**")
+    c1, c2 = st.columns([3, 1])
+    new_status = c1.selectbox(
+        "Status",
+        STATUS_OPTIONS,
+        index=status_index(current_status),
+        key=f"status_quick_{oid}",
+    )
+    if c2.button("Update Status", key=f"btn_update_status_{oid}"):
+        try:
+            update_order_status(oid, new_status)
+            st.success("Status updated")
+            st.rerun(scope="app")
+        except Exception as e:
+            st.error(str(e))
+
+
+@st.fragment
+def edit_order_form(oid: str, o: dict):
+    c3, c4 = st.columns(2)
+    new_customer = c3.text_input(
+        "Customer Name",
+        value=o.get("customer_name", ""),
+        key=f"edit_customer_{oid}",
+    )
+    new_phone = c4.text_input(
+        "Phone",
+        value=o.get("phone", ""),
+        key=f"edit_phone_{oid}",
+    )
+
+    new_address = st.text_input(
+        "Address",
+        value=o.get("delivery_address", ""),
+        key=f"edit_address_{oid}",
+    )
+
+    pm_current = (o.get("payment_method") or "cash").strip().lower()
+    pm_index = _PM_INDEX.get(pm_current, _PM_INDEX["other"])
+
+    pm_choice = st.selectbox(
+        "Payment Method",
+        PM_OPTIONS,
+        index=pm_index,
+        key=f"pm_edit_{oid}",
+    )
+
+    pm_custom = ""
+    if pm_choice == "other":
+        pm_custom = st.text_input(
+            "Other payment method",
+            value="" if pm_current in PM_OPTIONS else pm_current,
+            key=f"pm_edit_other_{oid}",
+        )
+
+    payment_method_edit = pm_custom.strip().lower() if pm_choice == "other" else pm_choice
+
+    # ✅ IMPORTANT: use a unique editor key per order
+    items_df = items_to_df(o.get("items"))
+    edited_items_df = st.data_editor(
+        items_df,
+        num_rows="dynamic",
+        use_container_width=True,
+        key=f"items_edit_editor_{oid}",
+    )
+
+    st.info(f"Estimated total: {calc_total(df_to_items(edited_items_df)):.2f}")
+
+    if st.button("Save Changes", type="primary", key=f"btn_save_order_{oid}"):
+        try:
+            update_order(oid, {
+                "customer_name": new_customer,
+                "phone": new_phone,
+                "delivery_address": new_address,
+                "items": df_to_items(edited_items_df),
+                "payment_method": payment_method_edit
+            })
+            st.success("Order updated")
+            st.rerun(scope="app")
+        except Exception as e:
+            st.error(str(e))
+
+
+# Complaint images are immutable once written (uuid filenames), but key on
+# mtime anyway so a replaced file is never served stale from the cache.
+@st.cache_data(show_spinner=False)
+def _read_image_bytes(path: str, mtime_ns: int) -> bytes:
+    return Path(path).read_bytes()
+
+
+@st.fragment
+def complaint_details():
+    st.markdown("#### 🔎 Complaint Details")
+
+    complaint_statuses = ["new", "in_progress", "resolved"]
+    complaint_ids = _sorted_complaint_ids(_mtime_ns(COMPLAINTS_FILE))
+    selected_cid = st.selectbox("Select Complaint", complaint_ids, key="complaint_select")
+
+    cobj = get_complaint(selected_cid)
+    if not cobj:
+        st.error("Complaint not found.")
+        return
+
+    # ===== Full details =====
+    c1, c2 = st.columns(2)
+    c1.text_input("Complaint ID", value=str(cobj.get("complaint_id", "")), disabled=True)
+    c2.text_input("Order ID", value=str(cobj.get("order_id", "")), disabled=True)
+
+    c3, c4 = st.columns(2)
+    c3.text_input("Customer Name", value=str(cobj.get("customer_name", "")), disabled=True)
+    c4.text_input("Phone", value=str(cobj.get("phone", "")), disabled=True)
+
+    c5, c6 = st.columns(2)
+    category = c5.text_input("Category", value=str(cobj.get("category", "other") or "other"))
+    status = c6.selectbox(
+        "Status",
+        options=complaint_statuses,
+        index=complaint_statuses.index(cobj.get("status", "new")) if cobj.get("status", "new") in complaint_statuses else 0
+    )
+
+    assigned_to = st.text_input("Assigned To (optional)", value=str(cobj.get("assigned_to", "") or ""))
+    internal_note = st.text_area("Internal Note", value=str(cobj.get("internal_note", "") or ""), height=120)
+
+    st.markdown("##### Customer Message")
+    st.text_area("", value=str(cobj.get("message", "") or ""), height=140, disabled=True)
+
+    st.caption(f"Created at: {cobj.get('created_at')} | Updated at: {cobj.get('updated_at')}")
+
+    if st.button("Save Complaint Changes", type="primary", key="btn_save_complaint"):
+        ok = update_complaint(selected_cid, {
+            "category": category.strip() if category else "other",
+            "status": status,
+            "assigned_to": assigned_to.strip(),
+            "internal_note": internal_note.strip(),
+        })
+        if ok:
+            st.success("✅ Complaint updated.")
+            st.rerun(scope="app")
+        else:
+            st.error("❌ Failed to update complaint.")
+
+    # ===== Images section =====
+    st.divider()
+    st.markdown("#### 🖼️ Attached Images")
+
+    images = cobj.get("images") or []
+    if not images:
+        st.info("No images attached to this complaint.")
+    else:
+        for i, img_path in enumerate(images, start=1):
+            p = Path(str(img_path))
+            if not p.exists():
+                st.warning(f"Image not found: {img_path}")
+                continue
+
+            st.markdown(f"**Image {i}**")
+            try:
+                st.image(str(p), use_container_width=True)
+            except Exception:
+                st.warning(f"Could not display image: {img_path}")
+
+            # Download button (FIX: pass bytes)
+            try:
+                data = _read_image_bytes(str(p), p.stat().st_mtime_ns)
+                st.download_button(
+                    label=f"Download Image {i}",
+                    data=data,
+                    file_name=p.name,
+                    mime="image/jpeg" if p.suffix.lower() in [".jpg", ".jpeg"] else "image/png",
+                    key=f"dl_{selected_cid}_{i}"
+                )
+            except Exception:
+                pass
+
+
 # =========================
 # Load data
 # =========================
-orders = list_orders(lang="en") or {}
-complaints = list_complaints() or []
+# Every widget click reruns this whole script; cache the formatted views
+# keyed on the data file's mtime so reruns skip the parse + dict rebuild
+# until the underlying file actually changes. Mutations below end in
+# st.rerun(), which picks up the new mtime -> fresh cache entry.
+def _mtime_ns(path) -> int:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+
+@st.cache_data(show_spinner=False)
+def _orders_view(mtime_ns: int) -> dict:
+    return list_orders(lang="en") or {}
+
+
+@st.cache_data(show_spinner=False)
+def _complaints_view(mtime_ns: int) -> list:
+    return list_complaints() or []
+
+
+@st.cache_data(show_spinner=False)
+def _orders_table(mtime_ns: int) -> pd.DataFrame:
+    df = pd.DataFrame.from_records(
+        [
+            {
+                "order_id": oid,
+                "customer": o.get("customer_name"),
+                "phone": o.get("phone"),
+                "payment": o.get("payment_method"),
+                "status": o.get("status"),
+                # total is persisted at save time; fall back for orders
+                # written before the field existed
+                "total": o.get("total", calc_total(o.get("items"))),
+                "updated": o.get("last_updated"),
+            }
+            for oid, o in list_orders_raw().items()
+        ],
+        columns=["order_id", "customer", "phone", "payment", "status", "total", "updated"],
+    )
+    # explicit dtypes so st.dataframe skips per-rerun schema inference
+    df["total"] = pd.to_numeric(df["total"], errors="coerce").fillna(0.0)
+    df["updated"] = pd.to_datetime(df["updated"], errors="coerce")
+    return df
+
+
+@st.cache_data(show_spinner=False)
+def _complaints_table(mtime_ns: int) -> pd.DataFrame:
+    df = pd.DataFrame.from_records(
+        list_complaints() or [],
+        columns=["complaint_id", "order_id", "category", "status", "assigned_to", "created_at", "updated_at"],
+    )
+    df["created_at"] = pd.to_datetime(df["created_at"], errors="coerce")
+    df["updated_at"] = pd.to_datetime(df["updated_at"], errors="coerce")
+    return df
+
+
+_ORDERS_COLUMN_CONFIG = {
+    "total": st.column_config.NumberColumn("total", format="%.2f"),
+    "updated": st.column_config.DatetimeColumn("updated"),
+}
+
+_COMPLAINTS_COLUMN_CONFIG = {
+    "created_at": st.column_config.DatetimeColumn("created_at"),
+    "updated_at": st.column_config.DatetimeColumn("updated_at"),
+}
+
+
+def _render_table(df: pd.DataFrame, column_config: dict, key: str):
+    """AgGrid (paginated, filterable) when st-aggrid is installed,
+    plain st.dataframe otherwise."""
+    if AgGrid is None:
+        st.dataframe(df, column_config=column_config, use_container_width=True, hide_index=True)
+        return
+    gob = GridOptionsBuilder.from_dataframe(df)
+    gob.configure_pagination(paginationAutoPageSize=True)
+    gob.configure_side_bar()
+    AgGrid(df, gridOptions=gob.build(), enable_enterprise_modules=False, key=key)
+
+
+@st.cache_data(show_spinner=False)
+def _sorted_order_ids(mtime_ns: int) -> list:
+    return sorted(list_orders_raw().keys())
+
+
+@st.cache_data(show_spinner=False)
+def _sorted_complaint_ids(mtime_ns: int) -> list:
+    return sorted(c.get("complaint_id") for c in (list_complaints() or []) if c.get("complaint_id"))
+
+
+orders = _orders_view(_mtime_ns(ORDERS_FILE))
+complaints = _complaints_view(_mtime_ns(COMPLAINTS_FILE))
 
 # =========================
 # KPIs
 # =========================
+# counting only needs statuses — read the shared cached dict instead of
+# the per-order formatted copies, and tally each collection in one pass
+orders_raw = list_orders_raw()
+order_counts = Counter(o.get("status") for o in orders_raw.values())
+complaint_counts = Counter(c.get("status") for c in complaints)
+
 k1, k2, k3, k4 = st.columns(4)
-k1.metric("Total Orders", len(orders))
-k2.metric("Delivered", sum(1 for o in orders.values() if o.get("status") == "delivered"))
-k3.metric("Open Complaints", sum(1 for c in complaints if c.get("status") in ["new", "in_progress"]))
-k4.metric("Resolved", sum(1 for c in complaints if c.get("status") == "resolved"))
+k1.metric("Total Orders", len(orders_raw))
+k2.metric("Delivered", order_counts.get("delivered", 0))
+k3.metric("Open Complaints", complaint_counts.get("new", 0) + complaint_counts.get("in_progress", 0))
+k4.metric("Resolved", complaint_counts.get("resolved", 0))
 
 st.divider()
 tab1, tab2, tab3 = st.tabs(["📦 Orders", "🧾 Complaints", "⚙️ Settings"])
@@ -168,7 +462,7 @@ with tab1:
        # -------- Edit Order --------
     if orders:
         st.markdown("#### ✏️ Edit Order")
-        oid = st.selectbox("Select Order", sorted(orders.keys()), key="edit_order_select")
+        oid = st.selectbox("Select Order", _sorted_order_ids(_mtime_ns(ORDERS_FILE)), key="edit_order_select")
 
         try:
             o = get_order(oid, lang="en")
@@ -183,104 +477,14 @@ with tab1:
             if order_changed:
                 st.session_state["_last_edit_oid"] = oid
 
-            # Quick Status Update
-            st.markdown("**Quick Status Update**")
-            c1, c2 = st.columns([3, 1])
-            new_status = c1.selectbox(
-                "Status",
-                STATUS_OPTIONS,
-                index=status_index(o.get("status", "received")),
-                key=f"status_quick_{oid}",
-            )
-            if c2.button("Update Status", key=f"btn_update_status_{oid}"):
-                try:
-                    update_order_status(oid, new_status)
-                    st.success("Status updated")
-                    st.rerun()
-                except Exception as e:
-                    st.error(str(e))
-
+            quick_status_update(oid, o.get("status", "received"))
             st.divider()
+            edit_order_form(oid, o)
 
-            # Full Edit
-            c3, c4 = st.columns(2)
-            new_customer = c3.text_input(
-                "Customer Name",
-                value=o.get("customer_name", ""),
-                key=f"edit_customer_{oid}",
-            )
-            new_phone = c4.text_input(
-                "Phone",
-                value=o.get("phone", ""),
-                key=f"edit_phone_{oid}",
-            )
-
-            new_address = st.text_input(
-                "Address",
-                value=o.get("delivery_address", ""),
-                key=f"edit_address_{oid}",
-            )
-
-            pm_current = (o.get("payment_method") or "cash").strip().lower()
-            pm_default = pm_current if pm_current in PM_OPTIONS else "other"
-            pm_index = PM_OPTIONS.index(pm_default)
-
-            pm_choice = st.selectbox(
-                "Payment Method",
-                PM_OPTIONS,
-                index=pm_index,
-                key=f"pm_edit_{oid}",
-            )
-
-            pm_custom = ""
-            if pm_choice == "other":
-                pm_custom = st.text_input(
-                    "Other payment method",
-                    value="" if pm_current in PM_OPTIONS else pm_current,
-                    key=f"pm_edit_other_{oid}",
-                )
-
-            payment_method_edit = pm_custom.strip().lower() if pm_choice == "other" else pm_choice
-
-            # ✅ IMPORTANT: use a unique editor key per order
-            items_df = items_to_df(o.get("items"))
-            edited_items_df = st.data_editor(
-                items_df,
-                num_rows="dynamic",
-                use_container_width=True,
-                key=f"items_edit_editor_{oid}",
-            )
-
-            st.info(f"Estimated total: {calc_total(df_to_items(edited_items_df)):.2f}")
-
-            if st.button("Save Changes", type="primary", key=f"btn_save_order_{oid}"):
-                try:
-                    update_order(oid, {
-                        "customer_name": new_customer,
-                        "phone": new_phone,
-                        "delivery_address": new_address,
-                        "items": df_to_items(edited_items_df),
-                        "payment_method": payment_method_edit
-                    })
-                    st.success("Order updated")
-                    st.rerun()
-                except Exception as e:
-                    st.error(str(e))
-
-    # Orders Table
+    # Orders Table — cached DataFrame keyed on file mtime; reruns reuse
+    # the same frame identity until orders change on disk
     st.markdown("#### 📄 Orders List")
-    rows = []
-    for oid, o in orders.items():
-        rows.append({
-            "order_id": oid,
-            "customer": o.get("customer_name"),
-            "phone": o.get("phone"),
-            "payment": o.get("payment_method"),
-            "status": o.get("status"),
-            "total": calc_total(o.get("items")),
-            "updated": o.get("last_updated")
-        })
-    st.dataframe(rows, use_container_width=True, hide_index=True)
+    _render_table(_orders_table(_mtime_ns(ORDERS_FILE)), _ORDERS_COLUMN_CONFIG, key="orders_grid")
 
 # =========================
 # TAB 2: Complaints
@@ -288,109 +492,17 @@ with tab1:
 with tab2:
     st.markdown("### Complaints")
 
-    complaint_statuses = ["new", "in_progress", "resolved"]
-
     if not complaints:
         st.info("No complaints yet.")
     else:
         # ----------- Table (summary) -----------
         st.markdown("#### 📄 Complaints List")
-
-        rows = []
-        for c in complaints:
-            rows.append({
-                "complaint_id": c.get("complaint_id"),
-                "order_id": c.get("order_id"),
-                "category": c.get("category"),
-                "status": c.get("status"),
-                "assigned_to": c.get("assigned_to"),
-                "created_at": c.get("created_at"),
-                "updated_at": c.get("updated_at"),
-            })
-        st.dataframe(rows, use_container_width=True, hide_index=True)
+        _render_table(_complaints_table(_mtime_ns(COMPLAINTS_FILE)), _COMPLAINTS_COLUMN_CONFIG, key="complaints_grid")
 
         st.divider()
 
         # ----------- Details panel -----------
-        st.markdown("#### 🔎 Complaint Details")
-
-        complaint_ids = sorted([c.get("complaint_id") for c in complaints if c.get("complaint_id")])
-        selected_cid = st.selectbox("Select Complaint", complaint_ids, key="complaint_select")
-
-        cobj = get_complaint(selected_cid)
-        if not cobj:
-            st.error("Complaint not found.")
-        else:
-            # ===== Full details =====
-            c1, c2 = st.columns(2)
-            c1.text_input("Complaint ID", value=str(cobj.get("complaint_id", "")), disabled=True)
-            c2.text_input("Order ID", value=str(cobj.get("order_id", "")), disabled=True)
-
-            c3, c4 = st.columns(2)
-            c3.text_input("Customer Name", value=str(cobj.get("customer_name", "")), disabled=True)
-            c4.text_input("Phone", value=str(cobj.get("phone", "")), disabled=True)
-
-            c5, c6 = st.columns(2)
-            category = c5.text_input("Category", value=str(cobj.get("category", "other") or "other"))
-            status = c6.selectbox(
-                "Status",
-                options=complaint_statuses,
-                index=complaint_statuses.index(cobj.get("status", "new")) if cobj.get("status", "new") in complaint_statuses else 0
-            )
-
-            assigned_to = st.text_input("Assigned To (optional)", value=str(cobj.get("assigned_to", "") or ""))
-            internal_note = st.text_area("Internal Note", value=str(cobj.get("internal_note", "") or ""), height=120)
-
-            st.markdown("##### Customer Message")
-            st.text_area("", value=str(cobj.get("message", "") or ""), height=140, disabled=True)
-
-            st.caption(f"Created at: {cobj.get('created_at')} | Updated at: {cobj.get('updated_at')}")
-
-            if st.button("Save Complaint Changes", type="primary", key="btn_save_complaint"):
-                ok = update_complaint(selected_cid, {
-                    "category": category.strip() if category else "other",
-                    "status": status,
-                    "assigned_to": assigned_to.strip(),
-                    "internal_note": internal_note.strip(),
-                })
-                if ok:
-                    st.success("✅ Complaint updated.")
-                    st.rerun()
-                else:
-                    st.error("❌ Failed to update complaint.")
-
-            # ===== Images section =====
-            st.divider()
-            st.markdown("#### 🖼️ Attached Images")
-
-            images = cobj.get("images") or []
-            if not images:
-                st.info("No images attached to this complaint.")
-            else:
-                for i, img_path in enumerate(images, start=1):
-                    p = Path(str(img_path))
-                    if not p.exists():
-                        st.warning(f"Image not found: {img_path}")
-                        continue
-
-                    st.markdown(f"**Image {i}**")
-                    try:
-                        st.image(str(p), use_container_width=True)
-                    except Exception:
-                        st.warning(f"Could not display image: {img_path}")
-
-                    # Download button (FIX: pass bytes)
-                    try:
-                        data = p.read_bytes()
-                        st.download_button(
-                            label=f"Download Image {i}",
-                            data=data,
-                            file_name=p.name,
-                            mime="image/jpeg" if p.suffix.lower() in [".jpg", ".jpeg"] else "image/png",
-                            key=f"dl_{selected_cid}_{i}"
-                        )
-                    except Exception:
-                        pass
+        complaint_details()
 
 # =========================
 # TAB 3: Settings
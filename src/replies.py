@@ -0,0 +1,142 @@
+"""
+Static bilingual reply templates for the deterministic FSM branches.
+
+Every canned customer-facing string lives here once, keyed by
+(reply key, language), instead of being rebuilt as an ar/en pair inside
+every branch of the flow. Dynamic values (complaint id, order lines)
+come in through str.format placeholders.
+"""
+
+from typing import Dict, Optional, Tuple
+
+REPLIES: Dict[Tuple[str, str], str] = {
+    ("system_probe", "ar"): (
+        "أقدر أساعدك بالأسئلة المتعلقة بالطلبات والخدمات (مثل التوصيل، الإرجاع، الاسترجاع).\n"
+        "إذا عندك سؤال محدد عن سياسة معينة، اسألني عنها مباشرة."
+    ),
+    ("system_probe", "en"): (
+        "I can help with customer-related questions (delivery, returns, refunds).\n"
+        "If you have a specific policy question, please ask it directly."
+    ),
+
+    ("escalation_need_order", "ar"): (
+        "أفهم قدّيش الموقف مزعج 🙏\n"
+        "حتى أقدر أتابع الشكوى بشكل صحيح، محتاج رقم الطلب (ORD-001) "
+        "أو رقم هاتفك إذا ما بتذكر رقم الطلب."
+    ),
+    ("escalation_need_order", "en"): (
+        "I understand how frustrating this can be 🙏\n"
+        "To proceed with your complaint, I need your Order ID (ORD-001) "
+        "or your phone number if you don’t remember it."
+    ),
+
+    ("selected_order_missing", "ar"): "❌ الطلب المختار غير موجود. جرّب رقم طلب آخر أو اكتب رقم هاتفك مرة ثانية.",
+    ("selected_order_missing", "en"): "❌ The selected order was not found. Please try another Order ID or type your phone number again.",
+
+    ("order_id_not_found", "ar"): "❌ رقم الطلب غير موجود. تأكد من الرقم (مثل: ORD-001) أو اكتب رقم هاتفك للبحث عن طلباتك.",
+    ("order_id_not_found", "en"): "❌ Order ID not found. Please check it (e.g., ORD-001) or type your phone number to find your orders.",
+
+    ("multi_match_continue", "ar"): "تم العثور على أكثر من طلب مرتبط برقم هاتفك:\n{lines}\n\nمن فضلك اكتب رقم الطلب حتى أكمل مساعدتك.",
+    ("multi_match_continue", "en"): "We found multiple orders linked to your phone:\n{lines}\n\nPlease type the Order ID to continue.",
+
+    ("multi_match_select", "ar"): "وجدنا أكثر من طلب مرتبط برقم هاتفك:\n{lines}\n\nمن فضلك اكتب رقم الطلب المقصود.",
+    ("multi_match_select", "en"): "We found multiple orders linked to your phone:\n{lines}\n\nPlease type the intended Order ID.",
+
+    ("ask_phone_for_order", "ar"): "تمام ✅ للتأكد من الأمان، اكتب رقم هاتفك المرتبط بالطلب.",
+    ("ask_phone_for_order", "en"): "Great ✅ For security, please type the phone number linked to the order.",
+
+    ("need_id_first", "ar"): (
+        "أفهم إن التأخير مزعج 🙏\n"
+        "عشان أقدر أربط الشكوى بطلبك بشكل صحيح، اكتب رقم الطلب (مثال: ORD-001) أو رقم هاتفك."
+    ),
+    ("need_id_first", "en"): (
+        "I understand delays are frustrating 🙏\n"
+        "To link the complaint to your order, please type your Order ID (e.g., ORD-001) or your phone number."
+    ),
+
+    ("need_id_repeat", "ar"): (
+        "أنا جاهز أرفع الشكوى فورًا، لكن لازم رقم الطلب أو رقم الهاتف حتى نكمل.\n"
+        "اكتب واحد منهم من فضلك."
+    ),
+    ("need_id_repeat", "en"): (
+        "I can file the complaint right away, but I need the Order ID or phone number to proceed.\n"
+        "Please send one of them."
+    ),
+
+    ("verify_fallback", "ar"): "اكتب رقم الطلب بصيغة (ORD-001)  أو اكتب رقم هاتفك بصيغة صحيحة لو سمحت.",
+    ("verify_fallback", "en"): "Please type your Order ID in this format (ORD-001) or type your phone number in correct format please.",
+
+    ("confirm_without_issue", "ar"): "تمام ✅ إذا بدك تسجل شكوى، اكتب وصف المشكلة التي واجهتك و مستاء بسببهاأولاً.",
+    ("confirm_without_issue", "en"): "Okay ✅ If you want to file a complaint, please describe the issue you faced and what upset you about it first.",
+
+    ("confirm_without_images", "ar"): "تمام ✅ بس لسه ما وصلني صور. ارفق الصور من (Attach Images) وبعدها اكتب (تم/تأكيد).",
+    ("confirm_without_images", "en"): "Okay ✅ but I still didn't receive any images. Attach them using (Attach Images), then type (confirm/yes).",
+
+    ("general_complaint_confirm", "ar"): (
+        "أفهم قدّيش الموقف مزعج 🙏\n"
+        "حبيت أوضح المشكلة 👍\n"
+        "هل حابب أسجل شكوى رسمية بخصوص التأخير؟\n"
+        "اكتب (نعم) للتأكيد أو اشرح أكثر إذا بتحب."
+    ),
+    ("general_complaint_confirm", "en"): (
+        "I understand how frustrating this can be 🙏\n"
+        "Thanks for explaining 👍\n"
+        "Would you like me to submit an official complaint about the delay?\n"
+        "Type (yes) to confirm or explain more."
+    ),
+
+    ("general_complaint_confirm_short", "ar"): (
+        "أفهم قدّيش الموقف مزعج 🙏\n"
+        "وصلتني تفاصيل المشكلة 👍\n"
+        "هل تحب أسجل شكوى رسمية بخصوص التأخير؟\n"
+        "اكتب (نعم) للتأكيد."
+    ),
+    ("general_complaint_confirm_short", "en"): (
+        "I understand how frustrating this can be 🙏\n"
+        "Thanks for explaining 👍\n"
+        "Would you like me to submit an official complaint about the delay?\n"
+        "Type (yes) to confirm."
+    ),
+
+    ("complaint_recorded", "ar"): "✅ تم تسجيل الشكوى.\nرقم الشكوى: {complaint_id}",
+    ("complaint_recorded", "en"): "✅ Your complaint has been recorded.\nComplaint ID: {complaint_id}",
+
+    ("damage_after_delivery_only", "ar"): "يمكن تسجيل شكاوى التلف/النقص فقط بعد تسليم الطلب.",
+    ("damage_after_delivery_only", "en"): "Damage/missing complaints can only be submitted after delivery.",
+
+    ("attach_images_prompt", "ar"): "تمام. أرفق صور المشكلة من خيار (Attach Images) ثم اكتب (تم/تأكيد) لإرسال الشكوى.",
+    ("attach_images_prompt", "en"): "Okay. Attach images using (Attach Images), then type (confirm/yes) to submit.",
+
+    ("damage_recorded", "ar"): (
+        "نعتذر عن الإزعاج اللي واجهته 🙏\n"
+        "✅ تم تسجيل شكواك بنجاح، وسيتم متابعتها من قبل فريق الدعم.\n\n"
+        "رقم الشكوى:\n{complaint_id}\n\n"
+        "هل في شيء ثاني أقدر أساعدك فيه؟"
+    ),
+    ("damage_recorded", "en"): (
+        "We’re sorry for the inconvenience you experienced 🙏\n"
+        "Your complaint has been successfully recorded and will be reviewed by our support team.✅\n\n"
+        "Complaint ID:\n{complaint_id}"
+    ),
+
+    ("escalation_recorded", "ar"): "✅ تم تسجيل طلبك.\nرقم الشكوى: {complaint_id}",
+    ("escalation_recorded", "en"): "✅ Your request has been recorded.\nComplaint ID: {complaint_id}",
+}
+
+
+def reply_for(key: str, lang: Optional[str], *, default: str = "ar", **fmt) -> str:
+    """
+    Resolve one template. Unknown/unset languages fall back to `default`
+    (the FSM's historical behavior: Arabic everywhere except the
+    multi-match lists, which defaulted to English).
+    """
+    use = lang if lang in ("ar", "en") else default
+    text = REPLIES[(key, use)]
+    return text.format(**fmt) if fmt else text
+
+
+def format_order_list(matches, orders, lang: Optional[str]) -> str:
+    """One '- ORD-xxx | status' line per matched order, in the session language."""
+    if lang == "ar":
+        return "\n".join(f"- {oid} | الحالة: {orders.get(oid, {}).get('status', '-')}" for oid in matches)
+    return "\n".join(f"- {oid} | status: {orders.get(oid, {}).get('status', '-')}" for oid in matches)
@@ -1,10 +1,15 @@
 import os
 import uuid
+from functools import lru_cache
+
 import streamlit as st
 from pathlib import Path
 from config import COMPLAINT_IMAGES_DIR
-import os
 
+
+# app_header runs on every rerun of every page; the CSS file and the logo
+# probes never change within a process, so both are memoized at module level.
+@lru_cache(maxsize=8)
 def _safe_read(path: str) -> str:
     try:
         with open(path, "r", encoding="utf-8") as f:
@@ -12,20 +17,26 @@ def _safe_read(path: str) -> str:
     except Exception:
         return ""
 
-def app_header(title: str, subtitle: str = ""):
-    base_dir = os.path.dirname(__file__)
-    assets_dir = os.path.join(base_dir, "assets")
-
-    css_path = os.path.join(assets_dir, "style.css")
-    st.markdown(f"<style>{_safe_read(css_path)}</style>", unsafe_allow_html=True)
 
+@lru_cache(maxsize=1)
+def _resolve_logo_path(assets_dir: str):
     logo_candidates = [
         os.path.join(assets_dir, "TrustLine AI ChatBot.png"),
         os.path.join(assets_dir, "TrustLine AI ChatBot.jpg"),
         os.path.join(assets_dir, "TrustLine AI ChatBot.jpeg"),
         os.path.join(assets_dir, "TrustLine AI ChatBot.svg"),
     ]
-    logo_path = next((p for p in logo_candidates if os.path.exists(p)), None)
+    return next((p for p in logo_candidates if os.path.exists(p)), None)
+
+
+def app_header(title: str, subtitle: str = ""):
+    base_dir = os.path.dirname(__file__)
+    assets_dir = os.path.join(base_dir, "assets")
+
+    css_path = os.path.join(assets_dir, "style.css")
+    st.markdown(f"<style>{_safe_read(css_path)}</style>", unsafe_allow_html=True)
+
+    logo_path = _resolve_logo_path(assets_dir)
 
     c1, c2 = st.columns([1, 6])
     with c1: